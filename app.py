@@ -3,17 +3,35 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from plotly.offline import get_plotlyjs
 import io
 import base64
+import hashlib
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+import plotly.io as pio
+import pyarrow as pa
+import pyarrow.compute as pc
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from datetime import date
+from html import escape
+from pathlib import Path
+from urllib.parse import quote, unquote
 from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 
 # ─────────────────────────────────────────────
 # CONFIGURACIÓN DE PÁGINA
 # ─────────────────────────────────────────────
-st.set_page_config(
+PAGE_CONFIG = dict(
     page_title="Dashboard Limpieza",
     page_icon="⚡",
     layout="wide",
@@ -23,7 +41,7 @@ st.set_page_config(
 # ─────────────────────────────────────────────
 # ESTILOS CSS
 # ─────────────────────────────────────────────
-st.markdown("""
+CSS = """
 <style>
     /* Fondo general */
     .stApp {
@@ -117,7 +135,7 @@ st.markdown("""
     #MainMenu {visibility: hidden;}
     footer {visibility: hidden;}
 </style>
-""", unsafe_allow_html=True)
+"""
 
 
 # ─────────────────────────────────────────────
@@ -132,6 +150,13 @@ def get_tracker_column(df):
         return 'CBOX'
     return None
 
+def get_paneles_column(df):
+    """Detecta la columna de capacidad en paneles de BASE_DATOS"""
+    for col in df.columns:
+        if 'Panel' in str(col) or 'panel' in str(col):
+            return col
+    return None
+
 def get_strings_column(df):
     """Detecta el nombre exacto de la columna de strings"""
     for col in df.columns:
@@ -139,86 +164,991 @@ def get_strings_column(df):
             return col
     return None
 
-def load_excel(file) -> dict:
-    """Carga y procesa el archivo Excel"""
-    try:
-        xl = pd.ExcelFile(file)
-        sheets = xl.sheet_names
+def fecha_texto(fechas) -> list:
+    """Convierte una serie de fechas a etiquetas 'YYYY-MM-DD' (para ejes categóricos)"""
+    return pd.to_datetime(pd.Series(fechas)).dt.strftime('%Y-%m-%d').tolist()
 
-        if 'REGISTRO_DIARIO' not in sheets:
-            st.error("❌ No se encontró la hoja 'REGISTRO_DIARIO' en el archivo.")
-            return None
 
-        # Leer REGISTRO_DIARIO
-        df_reg = pd.read_excel(file, sheet_name='REGISTRO_DIARIO')
-        df_reg = df_reg.iloc[:, :10]
+# ─────────────────────────────────────────────
+# ESQUEMA COMPACTO DEL REGISTRO
+# ─────────────────────────────────────────────
 
-        tracker_col = get_tracker_column(df_reg)
-        if not tracker_col:
-            st.error("❌ No se encontró columna 'Tracker' o 'CBOX'.")
+COLS_ID      = ['Tracker', 'Inversor', 'CBOX']
+COLS_ENTERAS = ['Paneles Limpiados', 'Strings', 'Paneles Acumulados']
+COLS_FLOAT32 = ['% Avance', 'Potencia DC Asociada']
+
+
+def normalizar_ids(serie: pd.Series) -> pd.Series:
+    """Convierte identificadores (Tracker/Inversor/CBOX) a categóricos de texto"""
+    # Excel entrega IDs numéricos como float (12.0) → se llevan a entero antes de pasar a texto
+    if pd.api.types.is_float_dtype(serie):
+        valores = serie.dropna()
+        if (valores == valores.round()).all():
+            serie = serie.astype('Int64')
+    texto = serie.astype('string').str.strip().astype('category')
+    # IDs todos numéricos: categorías en orden numérico (1, 2, 10) y no de texto (1, 10, 2)
+    categorias = texto.cat.categories
+    numeros = pd.to_numeric(pd.Series(categorias), errors='coerce')
+    if len(categorias) and numeros.notna().all():
+        texto = texto.cat.reorder_categories(categorias[np.argsort(numeros.to_numpy(), kind='stable')])
+    return texto
+
+
+def entero_compacto(serie: pd.Series) -> pd.Series:
+    """Convierte a entero nullable del menor tamaño que contenga los valores"""
+    numeros = pd.to_numeric(serie, errors='coerce').round()
+    maximo = numeros.abs().max()
+    if pd.isna(maximo) or maximo <= np.iinfo(np.int16).max:
+        return numeros.astype('Int16')
+    if maximo <= np.iinfo(np.int32).max:
+        return numeros.astype('Int32')
+    return numeros.astype('Int64')
+
+
+def normalizar_registro(df: pd.DataFrame) -> tuple:
+    """Reduce el registro a un esquema compacto y reporta la memoria ahorrada
+
+    Fecha → datetime64 a medianoche, IDs → category, conteos → Int16/Int32,
+    potencia y avance → float32.
+    """
+    antes = int(df.memory_usage(deep=True).sum())
+    df = df.copy()
+
+    # Resolución fija: Excel, CSV y Parquet entregan fechas con unidades distintas
+    df['Fecha'] = pd.to_datetime(df['Fecha']).dt.normalize().astype('datetime64[ns]')
+    for col in COLS_ID:
+        if col in df.columns:
+            df[col] = normalizar_ids(df[col])
+    for col in COLS_ENTERAS:
+        if col in df.columns:
+            df[col] = entero_compacto(df[col])
+    for col in COLS_FLOAT32:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+
+    df = df.reset_index(drop=True)
+    despues = int(df.memory_usage(deep=True).sum())
+    memoria = {
+        'antes': antes,
+        'despues': despues,
+        'ahorro_pct': round((1 - despues / antes) * 100, 1) if antes else 0.0,
+    }
+    return df, memoria
+
+
+# ─────────────────────────────────────────────
+# JERARQUÍA TRACKER → CBOX → INVERSOR
+# ─────────────────────────────────────────────
+
+def construir_jerarquia(df_base: pd.DataFrame) -> pd.DataFrame:
+    """Arma la tabla Tracker → CBOX → Inversor desde BASE_DATOS, indexada por Tracker"""
+    if df_base is None:
+        return None
+    tracker_col = get_tracker_column(df_base)
+    if not tracker_col:
+        return None
+
+    jerarquia = pd.DataFrame({'Tracker': normalizar_ids(df_base[tracker_col])})
+    # Si BASE_DATOS no distingue Tracker de CBOX, la unidad es la propia CBOX
+    jerarquia['CBOX'] = normalizar_ids(df_base['CBOX']) if 'CBOX' in df_base.columns else jerarquia['Tracker']
+    if 'Inversor' in df_base.columns:
+        jerarquia['Inversor'] = normalizar_ids(df_base['Inversor'])
+    paneles_col = get_paneles_column(df_base)
+    if paneles_col:
+        jerarquia['Paneles'] = entero_compacto(df_base[paneles_col])
+
+    jerarquia = jerarquia.dropna(subset=['Tracker']).drop_duplicates(subset='Tracker')
+    return jerarquia.set_index('Tracker')
+
+
+def unir_jerarquia(df_reg: pd.DataFrame, jerarquia: pd.DataFrame, tracker_col: str) -> pd.DataFrame:
+    """Completa CBOX e Inversor del registro con un join indexado contra la jerarquía"""
+    df_reg = df_reg.copy()
+    if tracker_col == 'CBOX':
+        # El registro se lleva por CBOX: cada fila ya identifica su caja
+        df_reg['CBOX'] = df_reg['Tracker']
+    elif 'CBOX' not in df_reg.columns and jerarquia is not None:
+        # map sobre un categórico resuelve una vez por tracker, no por fila
+        df_reg['CBOX'] = df_reg['Tracker'].map(jerarquia['CBOX'])
+    if 'Inversor' not in df_reg.columns and jerarquia is not None and 'Inversor' in jerarquia.columns:
+        if tracker_col == 'CBOX':
+            # La clave del registro es la caja: tabla CBOX → Inversor (primer inversor de cada caja)
+            por_cbox = jerarquia.drop_duplicates('CBOX')
+            inversores = pd.Series(por_cbox['Inversor'].to_numpy(), index=por_cbox['CBOX'].astype(str).to_numpy())
+            df_reg['Inversor'] = df_reg['Tracker'].astype(str).map(inversores).astype(jerarquia['Inversor'].dtype)
+        else:
+            df_reg['Inversor'] = df_reg['Tracker'].map(jerarquia['Inversor'])
+    return df_reg
+
+
+def construir_indice(df: pd.DataFrame, col: str) -> dict:
+    """Índice valor → posiciones de fila (ordenadas) para filtrar sin recorrer la columna"""
+    if col not in df.columns:
+        return {}
+    return df.groupby(col, observed=True).indices
+
+
+# Hasta cuántos valores distintos conviene guardar un bitmap por valor;
+# sobre eso (p.ej. miles de trackers) se guardan las posiciones de fila
+MAX_BITMAPS = 512
+
+
+def construir_indices(df: pd.DataFrame) -> dict:
+    """Índices de filtrado: fechas preordenadas + bitmap (o posiciones) por valor de cada dimensión"""
+    n = len(df)
+    orden = np.argsort(df['Fecha'].to_numpy(), kind='stable')
+    indices = {
+        'n': n,
+        'Fecha': {'orden': orden, 'valores': df['Fecha'].to_numpy()[orden]},
+    }
+    for col in ['Inversor', 'CBOX', 'Tracker']:
+        grupos = construir_indice(df, col)
+        if not grupos:
+            continue
+        if len(grupos) <= MAX_BITMAPS:
+            bitmaps = {}
+            for valor, pos in grupos.items():
+                mask = np.zeros(n, dtype=bool)
+                mask[pos] = True
+                bitmaps[valor] = np.packbits(mask)
+            indices[col] = {'tipo': 'bitmap', 'valores': bitmaps}
+        else:
+            indices[col] = {'tipo': 'posiciones', 'valores': grupos}
+    return indices
+
+
+def _como_lista(valor, todos: str) -> list:
+    """Normaliza un filtro: 'Todos'/vacío → [], escalar → [escalar], lista → lista"""
+    if valor is None or (isinstance(valor, str) and valor == todos):
+        return []
+    if isinstance(valor, (list, tuple, set, np.ndarray, pd.Index)):
+        return [v for v in valor if v != todos]
+    return [valor]
+
+
+def _rango_fechas(fecha) -> tuple:
+    """Normaliza el filtro de fecha a (inicio, fin) o None para 'Todas'"""
+    if fecha is None or (isinstance(fecha, str) and fecha == 'Todas'):
+        return None
+    if isinstance(fecha, (list, tuple)):
+        if len(fecha) == 0:
             return None
+        return pd.Timestamp(fecha[0]), pd.Timestamp(fecha[-1])
+    return pd.Timestamp(fecha), pd.Timestamp(fecha)
+
+
+def mascara_fechas(indice: dict, n: int, inicio, fin) -> np.ndarray:
+    """Filas con Fecha en [inicio, fin] por búsqueda binaria sobre el índice ordenado"""
+    valores = indice['valores']
+    lo = np.searchsorted(valores, np.datetime64(inicio), side='left')
+    hi = np.searchsorted(valores, np.datetime64(fin), side='right')
+    mask = np.zeros(n, dtype=bool)
+    mask[indice['orden'][lo:hi]] = True
+    return mask
+
+
+def mascara_valores(indice: dict, n: int, valores: list) -> np.ndarray:
+    """Filas cuyo valor está en `valores`: OR de bitmaps (o de listas de posiciones)"""
+    if indice['tipo'] == 'bitmap':
+        bitmaps = [indice['valores'][v] for v in valores if v in indice['valores']]
+        if not bitmaps:
+            return np.zeros(n, dtype=bool)
+        return np.unpackbits(np.bitwise_or.reduce(bitmaps), count=n).astype(bool)
+    mask = np.zeros(n, dtype=bool)
+    for v in valores:
+        pos = indice['valores'].get(v)
+        if pos is not None:
+            mask[pos] = True
+    return mask
 
-        df_reg = df_reg.dropna(subset=['Fecha', tracker_col])
-        df_reg['Fecha'] = pd.to_datetime(df_reg['Fecha']).dt.date
-        df_reg = df_reg.rename(columns={tracker_col: 'Tracker'})
 
-        # Columna strings
-        strings_col = get_strings_column(df_reg)
-        if strings_col and strings_col != 'Strings':
-            df_reg = df_reg.rename(columns={strings_col: 'Strings'})
+# ─────────────────────────────────────────────
+# COBERTURA DE PLANTA (LIMPIO / PENDIENTE POR CICLO)
+# ─────────────────────────────────────────────
 
-        # Leer BASE_DATOS si existe
-        df_base = None
-        if 'BASE_DATOS' in sheets:
-            df_base = pd.read_excel(file, sheet_name='BASE_DATOS')
+def posiciones_en(unidades: pd.Index, serie: pd.Series) -> np.ndarray:
+    """Posición de cada valor de `serie` dentro de `unidades` (-1 si no está)"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Se resuelve una vez por categoría y se expande con los códigos
+        por_categoria = unidades.get_indexer(serie.cat.categories.astype(str))
+        codigos = serie.cat.codes.to_numpy()
+        return np.where(codigos >= 0, por_categoria[codigos], -1)
+    return unidades.get_indexer(serie.astype(str))
+
+
+# Fracción de su capacidad que debe limpiarse para dar una unidad por completa en la ronda
+COMPLETO_MIN = 0.99
+
+
+def tabla_unidades(jerarquia: pd.DataFrame, unidad: str = 'Tracker') -> pd.DataFrame:
+    """Unidades de registro de BASE_DATOS (columna 'Tracker') con CBOX, Inversor y Paneles
+
+    Si el registro se lleva por caja (`unidad` = 'CBOX') la unidad es la CBOX, con la
+    capacidad de sus trackers sumada.
+    """
+    tabla = jerarquia.reset_index()
+    if unidad == 'CBOX':
+        agg = {c: (c, 'sum' if c == 'Paneles' else 'first') for c in ['Inversor', 'Paneles'] if c in tabla.columns}
+        tabla = tabla.groupby('CBOX', observed=True, as_index=False).agg(**agg) if agg else tabla[['CBOX']].drop_duplicates()
+        tabla['Tracker'] = tabla['CBOX']
+    return tabla
+
+
+def capacidad_filas(df: pd.DataFrame, jerarquia: pd.DataFrame = None, unidad: str = 'Tracker') -> np.ndarray:
+    """Paneles de la unidad (tracker o CBOX) de cada fila según BASE_DATOS (NaN si no se conoce)"""
+    if jerarquia is None or 'Paneles' not in jerarquia.columns:
+        return np.full(len(df), np.nan)
+    tabla = tabla_unidades(jerarquia, unidad)
+    capacidad = tabla['Paneles'].to_numpy(dtype=np.float64, na_value=np.nan)
+    pos = posiciones_en(pd.Index(tabla['Tracker'].astype(str)), df['Tracker'])
+    return np.where(pos >= 0, capacidad[np.maximum(pos, 0)], np.nan)
+
+
+def paneles_en_ciclo(df: pd.DataFrame, jerarquia: pd.DataFrame = None, unidad: str = 'Tracker') -> pd.Series:
+    """Paneles de cada fila que cuentan para el avance de su ciclo
+
+    Lo acumulado por una unidad dentro de un ciclo se topa en su capacidad (fracción 1,
+    la misma regla que usa detectar_ciclos para la cobertura): el retrabajo no lleva
+    el % Avance sobre 100%. Sin capacidad en BASE_DATOS se usa la que implica el
+    '% Avance' de la fila; si tampoco hay, la fila cuenta completa.
+    """
+    paneles = df['Paneles Limpiados'].to_numpy(dtype=np.float64, na_value=0)
+    capacidad = capacidad_filas(df, jerarquia, unidad)
+    if '% Avance' in df.columns:
+        avance = df['% Avance'].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            implicita = np.where((avance > 0) & (avance <= 1), paneles / avance, np.nan)
+        capacidad = np.where(np.isnan(capacidad), implicita, capacidad)
+    if np.isnan(capacidad).all():
+        return pd.Series(paneles.astype(np.int64), index=df.index, name='Paneles Ciclo')
+
+    ciclo = df['Ciclo'].to_numpy(dtype=np.int64) if 'Ciclo' in df.columns else np.ones(len(df), dtype=np.int64)
+    codigos = pd.factorize(df['Tracker'].astype(str))[0]
+    orden = np.lexsort((df['Fecha'].to_numpy(), codigos, ciclo))
+    grupos = [ciclo[orden], codigos[orden]]
+    acumulado = pd.Series(paneles[orden]).groupby(grupos).cumsum().to_numpy()
+    topado = np.where(np.isnan(capacidad[orden]), acumulado, np.minimum(acumulado, capacidad[orden]))
+    previo = pd.Series(topado).groupby(grupos).shift(fill_value=0).to_numpy()
+
+    efectivo = np.empty(len(df))
+    efectivo[orden] = topado - previo
+    return pd.Series(np.round(efectivo).astype(np.int64), index=df.index, name='Paneles Ciclo')
+
+
+def fraccion_limpiada(df: pd.DataFrame, jerarquia: pd.DataFrame = None, unidad: str = 'Tracker') -> np.ndarray:
+    """Fracción de su unidad (tracker o CBOX) que limpia cada fila del registro
+
+    Paneles Limpiados / capacidad de la unidad según BASE_DATOS; sin capacidad se usa
+    el '% Avance' de la fila (fracción 0–1) y, si tampoco hay, cada fila es una limpieza completa.
+    """
+    fraccion = np.full(len(df), np.nan)
+    if jerarquia is not None and 'Paneles' in jerarquia.columns and 'Paneles Limpiados' in df.columns:
+        cap = capacidad_filas(df, jerarquia, unidad)
+        paneles = df['Paneles Limpiados'].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraccion = np.where(cap > 0, paneles / cap, np.nan)
+    if '% Avance' in df.columns:
+        avance = df['% Avance'].to_numpy(dtype=np.float64, na_value=np.nan)
+        fraccion = np.where(np.isnan(fraccion) & (avance > 0) & (avance <= 1), avance, fraccion)
+    return np.where(np.isnan(fraccion), 1.0, np.maximum(fraccion, 0.0))
 
-        # Calcular progreso correcto día a día
-        df_progreso = calcular_progreso(df_reg)
 
-        # Nombre de planta desde el archivo
-        nombre = file.name.replace('limpieza_en_seco_', '').replace('.xlsx', '').replace('.xls', '')
+def construir_cobertura(jerarquia: pd.DataFrame, df_reg: pd.DataFrame, unidad: str = 'Tracker') -> dict:
+    """Marca cada unidad de BASE_DATOS como limpia/pendiente en cada ciclo de limpieza
 
-        return {
-            'registro': df_reg,
-            'base': df_base,
-            'progreso': df_progreso,
-            'nombre': nombre,
-            'tracker_col': 'Tracker'
-        }
+    El resultado es una matriz booleana ciclos × unidades; una unidad está limpia en
+    un ciclo cuando lo limpiado en él alcanza COMPLETO_MIN de su capacidad. `unidad`
+    es 'Tracker' o, si el registro se lleva por caja, 'CBOX'. Sin columna 'Ciclo'
+    todo es el ciclo 1.
+    """
+    if jerarquia is None or len(jerarquia) == 0:
+        return None
+
+    tabla = tabla_unidades(jerarquia, unidad)
+    unidades = pd.Index(tabla['Tracker'].astype(str))
+
+    pesos = np.ones(len(unidades), dtype=np.int64)
+    if 'Paneles' in tabla.columns:
+        pesos = tabla['Paneles'].fillna(0).to_numpy(dtype=np.int64)
+
+    pos = posiciones_en(unidades, df_reg['Tracker'])
+    ciclo = df_reg['Ciclo'].to_numpy(dtype=np.int64) if 'Ciclo' in df_reg.columns else np.ones(len(df_reg), dtype=np.int64)
+    validos = pos >= 0
+    n_ciclos = int(ciclo.max()) if len(ciclo) else 1
+
+    # Fracción acumulada por (ciclo, unidad): un tracker limpiado en dos días cuenta una vez completo
+    limpiado = np.zeros((n_ciclos, len(unidades)))
+    np.add.at(limpiado, (ciclo[validos] - 1, pos[validos]), fraccion_limpiada(df_reg, jerarquia, unidad)[validos])
+    limpio = limpiado >= COMPLETO_MIN
+
+    return {
+        'unidad': unidad,
+        'tabla': tabla[[c for c in ['Tracker', 'CBOX', 'Inversor'] if c in tabla.columns]],
+        'pesos': pesos,
+        'limpio': limpio,
+    }
+
+
+def avance_ciclo(cobertura: dict, ciclo: int = None) -> float:
+    """% de la planta (ponderado por paneles si BASE_DATOS los trae) limpio en un ciclo"""
+    limpio = cobertura['limpio'][(ciclo or len(cobertura['limpio'])) - 1]
+    total = cobertura['pesos'].sum()
+    return round(float(cobertura['pesos'][limpio].sum() / total * 100), 2) if total else 0.0
+
+
+def pendientes_por(cobertura: dict, nivel: str = 'Inversor', ciclo: int = None) -> pd.DataFrame:
+    """Resumen de unidades limpias/pendientes agrupado por Inversor o CBOX"""
+    tabla = cobertura['tabla']
+    if nivel not in tabla.columns:
+        return pd.DataFrame(columns=[nivel, 'Total', 'Limpios', 'Pendientes', '% Avance'])
+    limpio = cobertura['limpio'][(ciclo or len(cobertura['limpio'])) - 1]
+    pesos = cobertura['pesos']
+
+    codigos, grupos = pd.factorize(tabla[nivel].astype(str))
+    n = len(grupos)
+    total   = np.bincount(codigos[codigos >= 0], minlength=n)
+    limpios = np.bincount(codigos[(codigos >= 0) & limpio], minlength=n)
+    peso_total  = np.bincount(codigos[codigos >= 0], weights=pesos[codigos >= 0], minlength=n)
+    peso_limpio = np.bincount(codigos[(codigos >= 0) & limpio], weights=pesos[(codigos >= 0) & limpio], minlength=n)
 
+    resumen = pd.DataFrame({
+        nivel: grupos,
+        'Total': total,
+        'Limpios': limpios,
+        'Pendientes': total - limpios,
+        '% Avance': np.round(np.divide(peso_limpio, peso_total, out=np.zeros(n), where=peso_total > 0) * 100, 2),
+    })
+    return resumen.sort_values(nivel).reset_index(drop=True)
+
+
+def trackers_pendientes(cobertura: dict, ciclo: int = None) -> pd.DataFrame:
+    """Lista de unidades aún no limpiadas en el ciclo"""
+    limpio = cobertura['limpio'][(ciclo or len(cobertura['limpio'])) - 1]
+    return cobertura['tabla'][~limpio].reset_index(drop=True)
+
+
+# ─────────────────────────────────────────────
+# VALIDACIÓN DE CALIDAD DE DATOS
+# ─────────────────────────────────────────────
+
+COLUMNAS_VALIDACION = ['Fila', 'Fecha', 'Tracker', 'Problema', 'Detalle']
+
+
+def _problemas(mask, filas, fechas: pd.Series, trackers: pd.Series, problema: str, detalle) -> pd.DataFrame:
+    """Arma las filas del reporte solo para los registros marcados (None si no hay)
+
+    Los textos (fecha, detalle) se construyen únicamente para las filas marcadas,
+    así el caso sin problemas no formatea nada. `detalle` puede ser un texto fijo
+    o una función que recibe las posiciones marcadas.
+    """
+    pos = np.flatnonzero(np.asarray(mask, dtype=bool))
+    if len(pos) == 0:
+        return None
+    fecha_raw = fechas.iloc[pos].reset_index(drop=True)
+    fecha_txt = parsear_fechas(fecha_raw).dt.strftime('%Y-%m-%d')
+    return pd.DataFrame({
+        'Fila':     np.asarray(filas)[pos],
+        'Fecha':    fecha_txt.fillna(fecha_raw.astype('string')).to_numpy(),
+        'Tracker':  trackers.iloc[pos].astype('string').to_numpy(),
+        'Problema': problema,
+        'Detalle':  np.asarray(detalle(pos), dtype=object) if callable(detalle) else detalle,
+    })
+
+
+def validar_registro(crudo: pd.DataFrame, df_reg: pd.DataFrame, filas: np.ndarray,
+                     jerarquia: pd.DataFrame, unidad: str = 'Tracker') -> pd.DataFrame:
+    """Reporte fila a fila de problemas de calidad, con chequeos vectorizados por columna
+
+    `crudo` es el registro tal como se leyó (índice = fila de Excel) y `df_reg` el
+    normalizado, alineado con `filas`. Se marcan filas incompletas, fechas inválidas,
+    conteos no numéricos o negativos, duplicados Fecha+Tracker, trackers ausentes en
+    BASE_DATOS y paneles por sobre la capacidad del tracker.
+    """
+    reportes = []
+
+    # ── Sobre los valores crudos ──────────────────
+    fecha_raw, tracker_raw = crudo['Fecha'], crudo['Tracker']
+    fecha = parsear_fechas(fecha_raw)
+    reportes.append(_problemas(
+        (fecha_raw.isna() | tracker_raw.isna()).to_numpy(), crudo.index, fecha_raw, tracker_raw,
+        'Fila incompleta', 'Falta Fecha o Tracker; la fila se omite'))
+    reportes.append(_problemas(
+        (fecha.isna() & fecha_raw.notna()).to_numpy(), crudo.index, fecha_raw, tracker_raw,
+        'Fecha inválida', 'Fecha no reconocida; la fila se omite'))
+    for col in ['Paneles Limpiados', 'Strings']:
+        if col not in crudo.columns:
+            continue
+        raw = crudo[col]
+        num = pd.to_numeric(raw, errors='coerce')
+        reportes.append(_problemas(
+            (num.isna() & raw.notna()).to_numpy(), crudo.index, fecha_raw, tracker_raw, f'{col} no numérico',
+            lambda pos, raw=raw: 'Valor "' + raw.iloc[pos].astype(str) + '" se toma como vacío'))
+        reportes.append(_problemas(
+            (num < 0).to_numpy(), crudo.index, fecha_raw, tracker_raw, f'{col} negativo',
+            lambda pos, num=num: 'Valor ' + num.iloc[pos].map('{:g}'.format)))
+
+    # ── Sobre el registro normalizado ─────────────
+    fechas, trackers = df_reg['Fecha'], df_reg['Tracker']
+    reportes.append(_problemas(
+        df_reg.duplicated(['Fecha', 'Tracker'], keep=False).to_numpy(), filas, fechas, trackers,
+        'Registro duplicado', 'Mismo Tracker más de una vez en la fecha'))
+
+    if jerarquia is not None:
+        if unidad == 'CBOX':
+            tabla = jerarquia.reset_index().groupby('CBOX', observed=True)
+            unidades = pd.Index(tabla.size().index.astype(str))
+            capacidad = tabla['Paneles'].sum().to_numpy(dtype=np.float64) if 'Paneles' in jerarquia.columns else None
+        else:
+            unidades = pd.Index(jerarquia.index.astype(str))
+            capacidad = jerarquia['Paneles'].to_numpy(dtype=np.float64, na_value=np.nan) if 'Paneles' in jerarquia.columns else None
+
+        pos = posiciones_en(unidades, trackers)
+        reportes.append(_problemas(
+            pos < 0, filas, fechas, trackers,
+            'Tracker fuera de BASE_DATOS', 'No existe en la hoja BASE_DATOS'))
+
+        if capacidad is not None and 'Paneles Limpiados' in df_reg.columns:
+            cap = np.where(pos >= 0, capacidad[np.maximum(pos, 0)], np.nan)
+            paneles = df_reg['Paneles Limpiados'].to_numpy(dtype=np.float64, na_value=np.nan)
+            reportes.append(_problemas(
+                paneles > cap, filas, fechas, trackers, 'Paneles sobre capacidad',
+                lambda p: [f'{a:.0f} paneles > capacidad {b:.0f}' for a, b in zip(paneles[p], cap[p])]))
+
+    reportes = [r for r in reportes if r is not None]
+    if not reportes:
+        return pd.DataFrame(columns=COLUMNAS_VALIDACION)
+    return pd.concat(reportes, ignore_index=True).sort_values(['Fila', 'Problema'], kind='stable').reset_index(drop=True)
+
+
+# ─────────────────────────────────────────────
+# LECTURA DE ARCHIVOS (EXCEL, CSV, PARQUET)
+# ─────────────────────────────────────────────
+
+FORMATOS_ARCHIVO = ['xlsx', 'xls', 'csv', 'parquet']
+
+# Firmas de los primeros bytes; sin firma reconocida se usa la extensión
+FIRMAS = {b'PAR1': 'parquet', b'PK\x03\x04': 'excel', b'\xd0\xcf\x11\xe0': 'excel'}
+
+
+def detectar_formato(file) -> str:
+    """Detecta 'excel', 'parquet' o 'csv' por los primeros bytes (o la extensión)"""
+    inicio = file.read(4)
+    file.seek(0)
+    if inicio in FIRMAS:
+        return FIRMAS[inicio]
+    extension = Path(getattr(file, 'name', '')).suffix.lower()
+    if extension == '.parquet':
+        return 'parquet'
+    return 'excel' if extension in ('.xlsx', '.xls') else 'csv'
+
+
+# Codificaciones probadas en orden; Excel en español exporta CSV en cp1252 si no se pide UTF-8
+CODIFICACIONES_CSV = ['utf-8', 'cp1252', 'latin-1']
+
+
+def detectar_codificacion(contenido: bytes) -> str:
+    """Primera codificación de CODIFICACIONES_CSV que decodifica el contenido completo"""
+    for codificacion in CODIFICACIONES_CSV:
+        try:
+            contenido.decode(codificacion)
+            return codificacion
+        except UnicodeDecodeError:
+            continue
+    return CODIFICACIONES_CSV[-1]
+
+
+def leer_tabla(file, formato: str) -> pd.DataFrame:
+    """Lee una tabla CSV (lector multihilo de pyarrow) o Parquet (lectura directa)
+
+    Un CSV separado por ';' se trata como exportación en español: coma decimal
+    (50,5). Las fechas en texto se resuelven después con parsear_fechas.
+    """
+    if formato == 'parquet':
+        return pd.read_parquet(file)
+    contenido = file.read()
+    file.seek(0)
+    codificacion = detectar_codificacion(contenido)
+    encabezado = contenido.split(b'\n', 1)[0]
+    if encabezado.count(b';') > encabezado.count(b','):
+        return pd.read_csv(file, sep=';', decimal=',', encoding=codificacion, engine='pyarrow')
+    return pd.read_csv(file, sep=',', encoding=codificacion, engine='pyarrow')
+
+
+def parsear_fechas(serie: pd.Series) -> pd.Series:
+    """Fechas del registro: datetime tal cual; texto ISO (2024-02-13) o con el día primero (13/02/2024)
+
+    Lo ilegible queda vacío (NaT) para que la validación lo reporte.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    fechas = pd.to_datetime(serie, errors='coerce', format='ISO8601')
+    pendientes = fechas.isna() & serie.notna()
+    if pendientes.any():
+        fechas[pendientes] = pd.to_datetime(serie[pendientes].astype(str), errors='coerce', dayfirst=True)
+    return fechas
+
+
+def leer_hojas(file, base=None) -> dict:
+    """Front-end de ingesta: retorna {'REGISTRO_DIARIO': df, 'BASE_DATOS': df | None}
+
+    Excel trae ambas hojas; CSV/Parquet traen solo el registro y la base puede
+    venir en un segundo archivo (`base`) en cualquiera de los tres formatos.
+    """
+    formato = detectar_formato(file)
+    if formato == 'excel':
+        xl = pd.ExcelFile(file)
+        if 'REGISTRO_DIARIO' not in xl.sheet_names:
+            return None
+        hojas = {'REGISTRO_DIARIO': xl.parse('REGISTRO_DIARIO'), 'BASE_DATOS': None}
+        if 'BASE_DATOS' in xl.sheet_names:
+            hojas['BASE_DATOS'] = xl.parse('BASE_DATOS')
+    else:
+        hojas = {'REGISTRO_DIARIO': leer_tabla(file, formato), 'BASE_DATOS': None}
+
+    if base is not None:
+        formato_base = detectar_formato(base)
+        if formato_base == 'excel':
+            xl = pd.ExcelFile(base)
+            hoja = 'BASE_DATOS' if 'BASE_DATOS' in xl.sheet_names else 0
+            hojas['BASE_DATOS'] = xl.parse(hoja)
+        else:
+            hojas['BASE_DATOS'] = leer_tabla(base, formato_base)
+    return hojas
+
+
+def nombre_planta(nombre_archivo: str) -> str:
+    """Nombre de planta desde el archivo: limpieza_en_seco_Sauce.xlsx → Sauce"""
+    return Path(nombre_archivo).stem.replace('limpieza_en_seco_', '')
+
+
+class LibroInvalido(ValueError):
+    """El archivo no tiene la estructura esperada (hoja o columnas faltantes)"""
+
+
+def procesar_libro(file, base=None) -> dict:
+    """Carga y procesa el archivo de limpieza (Excel, CSV o Parquet)
+
+    Todos los formatos pasan por la misma normalización, así registro, base
+    y progreso son idénticos sin importar de dónde vino el dato. Lanza
+    LibroInvalido si falta la estructura mínima; sirve también fuera de una
+    sesión (hilo de la carpeta vigilada), donde st.error no llega a nadie.
+    """
+    hojas = leer_hojas(file, base)
+
+    if hojas is None:
+        raise LibroInvalido("No se encontró la hoja 'REGISTRO_DIARIO' en el archivo.")
+
+    # Leer REGISTRO_DIARIO
+    df_reg = hojas['REGISTRO_DIARIO']
+    df_reg = df_reg.iloc[:, :10]
+
+    tracker_col = get_tracker_column(df_reg)
+    if not tracker_col:
+        raise LibroInvalido("No se encontró columna 'Tracker' o 'CBOX'.")
+
+    df_reg = df_reg.rename(columns={tracker_col: 'Tracker'})
+
+    # Columna strings
+    strings_col = get_strings_column(df_reg)
+    if strings_col and strings_col != 'Strings':
+        df_reg = df_reg.rename(columns={strings_col: 'Strings'})
+
+    # Se conserva el registro crudo (índice = fila de Excel) para el reporte de validación;
+    # fechas ilegibles pasan a vacías y esas filas se omiten en vez de abortar la carga
+    crudo = df_reg.set_axis(df_reg.index + 2)
+    df_reg = crudo.assign(Fecha=parsear_fechas(crudo['Fecha']))
+    df_reg = df_reg.dropna(subset=['Fecha', 'Tracker'])
+    filas = df_reg.index.to_numpy()
+
+    # Esquema compacto (fechas, categóricos, enteros pequeños)
+    df_reg, memoria = normalizar_registro(df_reg)
+
+    # BASE_DATOS si existe (hoja del Excel o archivo aparte)
+    df_base = hojas['BASE_DATOS']
+
+    # Jerarquía Tracker → CBOX → Inversor
+    jerarquia = construir_jerarquia(df_base)
+    df_reg = unir_jerarquia(df_reg, jerarquia, tracker_col)
+    df_reg['Ciclo'] = detectar_ciclos(df_reg, jerarquia, unidad=tracker_col)
+    df_reg['Paneles Ciclo'] = entero_compacto(paneles_en_ciclo(df_reg, jerarquia, unidad=tracker_col))
+    capacidad = capacidad_planta(jerarquia)
+
+    # Validación de calidad (reporte descargable, no bloquea la carga)
+    validacion = validar_registro(crudo, df_reg, filas, jerarquia, unidad=tracker_col)
+
+    # Índices de filtrado (fechas ordenadas y bitmaps por dimensión)
+    indices = construir_indices(df_reg)
+
+    # Cobertura de planta: qué queda por limpiar según BASE_DATOS
+    cobertura = construir_cobertura(jerarquia, df_reg, unidad=tracker_col)
+
+    # Matriz tracker × día para el heatmap
+    matriz = construir_matriz(df_reg)
+
+    # Calcular progreso correcto día a día
+    df_progreso = calcular_progreso(df_reg, capacidad)
+    df_ciclos = resumen_ciclos(df_reg, capacidad)
+
+    # Nombre de planta desde el archivo
+    nombre = nombre_planta(file.name)
+
+    return {
+        'registro': df_reg,
+        'base': df_base,
+        'jerarquia': jerarquia,
+        'indices': indices,
+        'cobertura': cobertura,
+        'matriz': matriz,
+        'progreso': df_progreso,
+        'ciclos': df_ciclos,
+        'capacidad': capacidad,
+        'nombre': nombre,
+        'tracker_col': 'Tracker',
+        'memoria': memoria,
+        'validacion': validacion
+    }
+
+
+
+def load_excel(file, base=None) -> dict:
+    """procesar_libro para la sesión: los errores se muestran con st.error y retorna None"""
+    try:
+        return procesar_libro(file, base)
+    except LibroInvalido as e:
+        st.error(f"❌ {str(e)}")
+        return None
     except Exception as e:
         st.error(f"❌ Error al procesar el archivo: {str(e)}")
         return None
 
 
-def calcular_progreso(df: pd.DataFrame) -> pd.DataFrame:
-    """Calcula el progreso acumulado correcto día a día"""
-    total_paneles = df['Paneles Acumulados'].max() if 'Paneles Acumulados' in df.columns else df['Paneles Limpiados'].sum()
+def calcular_progreso(df: pd.DataFrame, capacidad: float = None) -> pd.DataFrame:
+    """Calcula el progreso acumulado correcto día a día
+
+    Con columna 'Ciclo' el acumulado se reinicia en cada ronda; con 'Paneles Ciclo'
+    (paneles_en_ciclo) el retrabajo dentro del ciclo no suma, así el % Avance no
+    supera el 100%. `capacidad` es el total de paneles de la planta (BASE_DATOS);
+    si no se entrega se estima con los registros del primer ciclo.
+    """
+    ciclo = df['Ciclo'] if 'Ciclo' in df.columns else pd.Series(1, index=df.index)
+    avance = 'Paneles Ciclo' if 'Paneles Ciclo' in df.columns else 'Paneles Limpiados'
 
-    resumen = (
-        df.groupby('Fecha')['Paneles Limpiados']
+    if not capacidad:
+        primero = df[ciclo == ciclo.min()] if len(df) else df
+        capacidad = primero['Paneles Acumulados'].max() if 'Paneles Acumulados' in df.columns else primero[avance].sum()
+
+    # Acumulado de cada ciclo por (Fecha, Ciclo); cada día muestra el de su ciclo más reciente
+    por_ciclo = (
+        df[['Paneles Limpiados', avance]].groupby([df['Fecha'], ciclo.rename('Ciclo')])
         .sum()
-        .reset_index()
-        .sort_values('Fecha')
+        .sort_index()
     )
-    resumen['Acumulado'] = resumen['Paneles Limpiados'].cumsum()
-    resumen['% Avance'] = (resumen['Acumulado'] / total_paneles * 100).round(2)
-    resumen.columns = ['Fecha', 'Paneles del Día', 'Paneles Acumulados', '% Avance']
+    acumulado = por_ciclo[avance].groupby(level='Ciclo').cumsum()
+    del_dia = por_ciclo['Paneles Limpiados'].groupby(level='Fecha').sum()
+    ultimo = acumulado.reset_index().drop_duplicates('Fecha', keep='last')
+
+    resumen = pd.DataFrame({
+        'Fecha': del_dia.index,
+        'Paneles del Día': del_dia.to_numpy(dtype=np.int64),
+        'Paneles Acumulados': ultimo[avance].to_numpy(dtype=np.int64),
+    })
+    resumen['% Avance'] = (resumen['Paneles Acumulados'] / capacidad * 100).round(2) if capacidad else 0.0
+    resumen['Ciclo'] = ultimo['Ciclo'].to_numpy()
     return resumen
 
 
-def apply_filters(df: pd.DataFrame, fecha, inversor, cbox, tracker) -> pd.DataFrame:
-    """Aplica filtros al dataframe"""
-    filtered = df.copy()
-    if fecha != 'Todas':
-        filtered = filtered[filtered['Fecha'] == pd.to_datetime(fecha).date()]
-    if inversor != 'Todos':
-        filtered = filtered[filtered['Inversor'] == inversor]
-    if cbox != 'Todos' and 'CBOX' in df.columns:
-        filtered = filtered[filtered['CBOX'] == cbox]
-    if tracker != 'Todos':
-        filtered = filtered[filtered['Tracker'] == tracker]
-    return filtered
+# ─────────────────────────────────────────────
+# CICLOS DE LIMPIEZA
+# ─────────────────────────────────────────────
+
+# Fracción de la planta cubierta en un ciclo antes de aceptar que empezó la ronda siguiente
+COBERTURA_MIN_CICLO = 0.9
+
+
+def detectar_ciclos(df: pd.DataFrame, jerarquia: pd.DataFrame = None, unidad: str = 'Tracker') -> pd.Series:
+    """Asigna a cada registro la ronda de limpieza (ciclo) a la que pertenece
+
+    Cada tracker acumula la fracción limpiada en su ronda (fraccion_limpiada) y solo
+    al completarla puede pasar a la siguiente. La planta abre el ciclo k+1 cuando un
+    tracker completo se vuelve a limpiar y el ciclo k ya cubre COBERTURA_MIN_CICLO de
+    la planta; antes de eso la repetición es retrabajo y cuenta en el ciclo k. Así un
+    tracker limpiado en dos días o visto por primera vez tarde sigue en su ronda; un
+    tracker que se saltó una ronda entera se pone al día con el ciclo anterior de la planta.
+    """
+    n = len(df)
+    if n == 0:
+        return pd.Series(np.array([], dtype=np.int16), index=df.index, name='Ciclo')
+
+    codigos, unidades = pd.factorize(df['Tracker'].astype(str))
+    fraccion = fraccion_limpiada(df, jerarquia, unidad)
+
+    # Peso de cada unidad en la cobertura: sus paneles si BASE_DATOS los trae
+    pesos = np.ones(len(unidades))
+    total = float(len(unidades))
+    if jerarquia is not None and 'Paneles' in jerarquia.columns:
+        tabla = tabla_unidades(jerarquia, unidad)
+        capacidad = tabla['Paneles'].to_numpy(dtype=np.float64, na_value=0)
+        pos = pd.Index(tabla['Tracker'].astype(str)).get_indexer(unidades)
+        pesos = np.where(pos >= 0, capacidad[np.maximum(pos, 0)], 0.0)
+        total = float(capacidad.sum()) or total
+
+    fechas = df['Fecha'].to_numpy()
+    orden = np.argsort(fechas, kind='stable')
+    _, inicios = np.unique(fechas[orden], return_index=True)
+    limites = np.append(inicios, n)
+
+    ronda = np.ones(len(unidades), dtype=np.int64)
+    acumulado = np.zeros(len(unidades))
+    ciclo_planta = 1
+    ciclo = np.empty(n, dtype=np.int16)
+    # Un paso por día (no por fila): dentro del día todo es vectorial
+    for a, b in zip(limites[:-1], limites[1:]):
+        filas = orden[a:b]
+        t = codigos[filas]
+        completos = acumulado[t] >= COMPLETO_MIN
+        if completos.any() and (ronda[t[completos]] == ciclo_planta).any():
+            en_ciclo = ronda == ciclo_planta
+            cubierto = (np.minimum(acumulado[en_ciclo], 1) * pesos[en_ciclo]).sum()
+            if cubierto >= COBERTURA_MIN_CICLO * total:
+                ciclo_planta += 1
+        avanza = np.unique(t[completos & (ronda[t] < ciclo_planta)])
+        ronda[avanza] += 1
+        acumulado[avanza] = 0
+        atrasados = np.unique(t[ronda[t] < ciclo_planta - 1])
+        ronda[atrasados] = ciclo_planta - 1
+        acumulado[atrasados] = 0
+        ciclo[filas] = ronda[t]
+        np.add.at(acumulado, t, fraccion[filas])
+    return pd.Series(ciclo, index=df.index, name='Ciclo')
+
+
+def capacidad_planta(jerarquia: pd.DataFrame) -> int:
+    """Total de paneles de la planta según BASE_DATOS (None si no hay capacidad)"""
+    if jerarquia is None or 'Paneles' not in jerarquia.columns:
+        return None
+    total = jerarquia['Paneles'].sum()
+    return int(total) if total else None
+
+
+def resumen_ciclos(df: pd.DataFrame, capacidad: float = None) -> pd.DataFrame:
+    """Avance, duración y rendimiento de cada ciclo en una sola agregación
+
+    El % Avance usa 'Paneles Ciclo' si existe (sin retrabajo); Paneles/Día, todo lo limpiado.
+    """
+    avance = 'Paneles Ciclo' if 'Paneles Ciclo' in df.columns else 'Paneles Limpiados'
+    ciclos = df.groupby('Ciclo').agg(
+        Inicio   = ('Fecha', 'min'),
+        Fin      = ('Fecha', 'max'),
+        Dias     = ('Fecha', 'nunique'),
+        Trackers = ('Tracker', 'nunique'),
+        Paneles  = ('Paneles Limpiados', 'sum'),
+        Avance   = (avance, 'sum'),
+    ).reset_index()
+    if not capacidad:
+        capacidad = ciclos['Avance'].iloc[0] if len(ciclos) else 0
+    ciclos['Duración (días)'] = (ciclos['Fin'] - ciclos['Inicio']).dt.days + 1
+    ciclos['Paneles/Día'] = (ciclos['Paneles'] / ciclos['Dias']).round(1)
+    ciclos['% Avance'] = (ciclos['Avance'] / capacidad * 100).round(2) if capacidad else 0.0
+    ciclos = ciclos.drop(columns='Avance')
+    return ciclos.rename(columns={'Dias': 'Días Activos', 'Paneles': 'Paneles Limpiados'})
+
+
+# ─────────────────────────────────────────────
+# MATRIZ TRACKER × DÍA (HEATMAP)
+# ─────────────────────────────────────────────
+
+# Sobre este número de celdas la matriz se guarda dispersa (solo celdas con limpieza)
+MAX_CELDAS_DENSAS = 1_000_000
+
+
+def construir_matriz(df: pd.DataFrame) -> dict:
+    """Paneles limpiados por tracker y día, armada una vez por dataset sin loops de Python
+
+    Densa (float32, trackers × días) si cabe en MAX_CELDAS_DENSAS; si no, dispersa en
+    formato coordenado: arrays fila/col/valor solo para las celdas limpiadas.
+    """
+    fechas = pd.DatetimeIndex(np.sort(df['Fecha'].unique()))
+    trackers_cat = df['Tracker'].astype('category').cat.remove_unused_categories()
+    trackers = pd.Index(trackers_cat.cat.categories)
+
+    fila = trackers_cat.cat.codes.to_numpy(dtype=np.int64)
+    col = fechas.get_indexer(df['Fecha']).astype(np.int64)
+    valor = df['Paneles Limpiados'].to_numpy(dtype=np.float64, na_value=0)
+    validos = fila >= 0
+    fila, col, valor = fila[validos], col[validos], valor[validos]
+
+    n_filas, n_cols = len(trackers), len(fechas)
+    lineal = fila * n_cols + col
+    if n_filas * n_cols <= MAX_CELDAS_DENSAS:
+        densa = np.bincount(lineal, weights=valor, minlength=n_filas * n_cols)
+        return {'trackers': trackers, 'fechas': fechas, 'formato': 'densa',
+                'valores': densa.reshape(n_filas, n_cols).astype(np.float32)}
+
+    # Dispersa: se consolidan las celdas repetidas (mismo tracker y día)
+    celdas, inverso = np.unique(lineal, return_inverse=True)
+    return {'trackers': trackers, 'fechas': fechas, 'formato': 'dispersa',
+            'fila': (celdas // n_cols).astype(np.int32),
+            'col': (celdas % n_cols).astype(np.int32),
+            'valor': np.bincount(inverso, weights=valor).astype(np.float32)}
+
+
+def matriz_en_bloques(matriz: dict, max_filas: int = 200, max_cols: int = 365) -> tuple:
+    """Reduce la matriz a teselas de a lo más max_filas × max_cols sumando bloques contiguos
+
+    Retorna (z, etiquetas_filas, etiquetas_cols, trackers_por_bloque, dias_por_bloque).
+    """
+    trackers, fechas = matriz['trackers'], matriz['fechas']
+    n_filas, n_cols = len(trackers), len(fechas)
+    paso_f = max(1, int(np.ceil(n_filas / max_filas)))
+    paso_c = max(1, int(np.ceil(n_cols / max_cols)))
+    b_filas = int(np.ceil(n_filas / paso_f))
+    b_cols = int(np.ceil(n_cols / paso_c))
+
+    if matriz['formato'] == 'densa':
+        fila, col = np.nonzero(matriz['valores'])
+        valor = matriz['valores'][fila, col]
+    else:
+        fila, col, valor = matriz['fila'], matriz['col'], matriz['valor']
+
+    bloque = (fila // paso_f).astype(np.int64) * b_cols + (col // paso_c)
+    z = np.bincount(bloque, weights=valor, minlength=b_filas * b_cols).reshape(b_filas, b_cols)
+
+    etiquetas_filas = [
+        str(trackers[i]) if paso_f == 1 else f'{trackers[i]} … {trackers[min(i + paso_f, n_filas) - 1]}'
+        for i in range(0, n_filas, paso_f)
+    ]
+    fechas_txt = fecha_texto(fechas)
+    etiquetas_cols = [
+        fechas_txt[j] if paso_c == 1 else f'{fechas_txt[j]} → {fechas_txt[min(j + paso_c, n_cols) - 1]}'
+        for j in range(0, n_cols, paso_c)
+    ]
+    return z, etiquetas_filas, etiquetas_cols, paso_f, paso_c
+
+
+# ─────────────────────────────────────────────
+# PRONÓSTICO DE TÉRMINO DEL CICLO
+# ─────────────────────────────────────────────
+
+# Más allá de este horizonte el término se reporta como sin estimación
+HORIZONTE_PRONOSTICO_DIAS = 730
+
+@st.cache_data(show_spinner=False)
+def pronosticar_termino(progreso: pd.DataFrame, ventana: int = 7, max_puntos: int = 90) -> dict:
+    """Proyecta cuándo el ciclo actual llega al 100% a partir del progreso diario
+
+    Ritmo central: pendiente de Theil–Sen (mediana de pendientes entre pares) del
+    % Avance vs días corridos del ciclo. Banda: percentiles 10/90 del ritmo en
+    ventanas móviles de `ventana` días activos. Un término a más de
+    HORIZONTE_PRONOSTICO_DIAS de la última fecha queda en None. Resultado cacheado por dataset.
+    """
+    vacio = {'ciclo': None, 'avance': 0.0, 'rendimiento': 0.0, 'ritmo': None,
+             'ritmo_bajo': None, 'ritmo_alto': None, 'fecha_estimada': None,
+             'fecha_optimista': None, 'fecha_pesimista': None, 'proyeccion': None}
+    if progreso is None or len(progreso) == 0:
+        return vacio
+
+    ciclo = int(progreso['Ciclo'].iloc[-1]) if 'Ciclo' in progreso.columns else 1
+    actual = progreso[progreso['Ciclo'] == ciclo] if 'Ciclo' in progreso.columns else progreso
+    actual = actual.tail(max_puntos)
+
+    fechas = pd.to_datetime(actual['Fecha'])
+    x = ((fechas - fechas.iloc[0]).dt.days).to_numpy(dtype=np.float64)
+    y = actual['% Avance'].to_numpy(dtype=np.float64)
+    ultima = fechas.iloc[-1]
+    resultado = dict(vacio, ciclo=ciclo, avance=float(y[-1]),
+                     rendimiento=float(actual['Paneles del Día'].tail(ventana).mean()))
+
+    if y[-1] >= 100:
+        return dict(resultado, fecha_estimada=ultima, fecha_optimista=ultima, fecha_pesimista=ultima)
+    if len(x) < 2:
+        return resultado
+
+    # Theil–Sen: mediana de todas las pendientes entre pares de días
+    i, j = np.triu_indices(len(x), k=1)
+    dx = x[j] - x[i]
+    validos = dx > 0
+    ritmo = float(np.median((y[j] - y[i])[validos] / dx[validos])) if validos.any() else 0.0
+
+    # Ritmos en ventanas móviles → banda de confianza
+    w = min(ventana, len(x) - 1)
+    dxw = x[w:] - x[:-w]
+    ritmos = np.divide(y[w:] - y[:-w], dxw, out=np.zeros(len(dxw)), where=dxw > 0)
+    bajo, alto = (np.percentile(ritmos, [10, 90]) if len(ritmos) else (ritmo, ritmo))
+    bajo, alto = min(bajo, ritmo), max(alto, ritmo)
+
+    def fecha_para(r):
+        if not r > 0:
+            return None
+        dias = np.ceil((100 - y[-1]) / r)
+        return ultima + pd.Timedelta(days=int(dias)) if dias <= HORIZONTE_PRONOSTICO_DIAS else None
+
+    resultado.update(ritmo=ritmo, ritmo_bajo=float(bajo), ritmo_alto=float(alto),
+                     fecha_estimada=fecha_para(ritmo),
+                     fecha_optimista=fecha_para(alto),
+                     fecha_pesimista=fecha_para(bajo))
+
+    # Curva proyectada hasta la fecha pesimista (o central); ambas dentro del horizonte
+    fin = resultado['fecha_pesimista'] or resultado['fecha_estimada']
+    if fin is not None:
+        futuro = pd.date_range(ultima, fin, freq='D')
+        dias = (futuro - ultima).days.to_numpy(dtype=np.float64)
+        resultado['proyeccion'] = pd.DataFrame({
+            'Fecha':    futuro,
+            'Estimado': np.minimum(y[-1] + ritmo * dias, 100),
+            'Bajo':     np.minimum(y[-1] + max(bajo, 0) * dias, 100),
+            'Alto':     np.minimum(y[-1] + alto * dias, 100),
+        })
+    return resultado
+
+
+def pronosticar_plantas(datasets: dict) -> pd.DataFrame:
+    """Modo batch: pronóstico de término para varias plantas (nombre → salida de load_excel)"""
+    filas = []
+    for nombre, data in datasets.items():
+        p = pronosticar_termino(data['progreso'])
+        filas.append({
+            'Planta':          nombre,
+            'Ciclo':           p['ciclo'],
+            '% Avance':        p['avance'],
+            'Paneles/Día':     round(p['rendimiento'], 1),
+            'Ritmo (%/día)':   round(p['ritmo'], 2) if p['ritmo'] is not None else None,
+            'Término Estimado':  p['fecha_estimada'],
+            'Término Optimista': p['fecha_optimista'],
+            'Término Pesimista': p['fecha_pesimista'],
+        })
+    return pd.DataFrame(filas)
+
+
+def apply_filters(df: pd.DataFrame, fecha, inversor, cbox, tracker, indices: dict = None) -> pd.DataFrame:
+    """Aplica filtros al dataframe
+
+    `fecha` puede ser 'Todas', una fecha o un rango (inicio, fin); Inversor/CBOX/Tracker
+    aceptan 'Todos', un valor o una lista de valores. Con `indices` (construir_indices
+    sobre el mismo `df`) cada filtro es una máscara sin recorrer columnas.
+    """
+    if indices is not None and indices.get('n') != len(df):
+        indices = None
+    n = len(df)
+    mask = np.ones(n, dtype=bool)
+
+    rango = _rango_fechas(fecha)
+    if rango is not None:
+        inicio, fin = rango
+        if indices is not None:
+            mask &= mascara_fechas(indices['Fecha'], n, inicio, fin)
+        else:
+            mask &= df['Fecha'].between(inicio, fin).to_numpy()
+
+    for col, valor in [('Inversor', inversor), ('CBOX', cbox), ('Tracker', tracker)]:
+        valores = _como_lista(valor, 'Todos')
+        if not valores or col not in df.columns:
+            continue
+        if indices is not None and col in indices:
+            mask &= mascara_valores(indices[col], n, valores)
+        else:
+            mask &= df[col].isin(valores).to_numpy()
+
+    return df[mask].copy()
 
 
 # ─────────────────────────────────────────────
@@ -271,144 +1201,363 @@ def render_kpis(df: pd.DataFrame, progreso: pd.DataFrame):
         """, unsafe_allow_html=True)
 
 
+# ── Colores de marca ──────────────────────
+COLOR_PRIMARY   = '#667eea'
+COLOR_SECONDARY = '#764ba2'
+COLOR_TEAL      = '#4ecdc4'
+COLOR_RED       = '#ff6b6b'
+PALETTE = [COLOR_PRIMARY, COLOR_SECONDARY, COLOR_TEAL, COLOR_RED,
+           '#a29bfe', '#fd79a8', '#00cec9', '#fdcb6e']
+
+
+def figura_trackers(df: pd.DataFrame) -> go.Figure:
+    """Gráfico 1: Paneles por Tracker"""
+    tracker_data = df.groupby('Tracker', observed=True)['Paneles Limpiados'].sum().reset_index().sort_values('Tracker')
+    # Convertir a tipos nativos Python para evitar problemas con numpy.int64
+    t_labels = tracker_data['Tracker'].tolist()
+    t_values = [int(v) for v in tracker_data['Paneles Limpiados'].tolist()]
+    fig1 = go.Figure(go.Bar(
+        x=t_labels,
+        y=t_values,
+        marker_color=COLOR_PRIMARY,
+        marker_line_color=COLOR_PRIMARY,
+        hovertemplate='<b>%{x}</b><br>Paneles: %{y:,}<extra></extra>'
+    ))
+    fig1.update_layout(
+        title='📊 Paneles Limpiados por Tracker',
+        plot_bgcolor='white', paper_bgcolor='white',
+        title_font_color=COLOR_PRIMARY,
+        showlegend=False,
+        xaxis=dict(tickangle=-45, type='category'),
+        height=350,
+        margin=dict(t=50, b=60)
+    )
+    return fig1
+
+
+def figura_progreso(progreso: pd.DataFrame) -> go.Figure:
+    """Gráfico 2: Progreso acumulado"""
+    # Convertir fechas a string YYYY-MM-DD y valores a float nativo
+    prog_labels = fecha_texto(progreso['Fecha'])
+    prog_values = [float(v) for v in progreso['% Avance'].tolist()]
+    prog_acum   = [int(v) for v in progreso['Paneles Acumulados'].tolist()]
+    prog_dia    = [int(v) for v in progreso['Paneles del Día'].tolist()]
+    fig2 = go.Figure()
+    fig2.add_trace(go.Scatter(
+        x=prog_labels,
+        y=prog_values,
+        mode='lines+markers',
+        fill='tozeroy',
+        line=dict(color=COLOR_SECONDARY, width=3),
+        marker=dict(size=10, color=COLOR_SECONDARY),
+        customdata=list(zip(prog_acum, prog_dia)),
+        hovertemplate=(
+            '<b>%{x}</b><br>'
+            'Avance: %{y:.2f}%<br>'
+            'Acumulado: %{customdata[0]:,} paneles<br>'
+            'Hoy: %{customdata[1]:,} paneles<extra></extra>'
+        )
+    ))
+    fig2.update_layout(
+        title='📈 Progreso Acumulado por Fecha',
+        title_font_color=COLOR_PRIMARY,
+        plot_bgcolor='white', paper_bgcolor='white',
+        yaxis=dict(range=[0, 105], ticksuffix='%'),
+        xaxis=dict(type='category'),   # ← clave: categoría, no datetime
+        height=350,
+        margin=dict(t=50, b=40)
+    )
+    return fig2
+
+
+def figura_potencia(df: pd.DataFrame) -> go.Figure:
+    """Gráfico 3: Potencia por Inversor (None si no hay columna de potencia)"""
+    if 'Potencia DC Asociada' not in df.columns:
+        return None
+    pot_data = df.groupby('Inversor', observed=True)['Potencia DC Asociada'].sum().reset_index()
+    # Convertir a tipos nativos Python
+    pot_labels = pot_data['Inversor'].tolist()
+    pot_values = [float(v) for v in pot_data['Potencia DC Asociada'].tolist()]
+    fig3 = go.Figure(go.Pie(
+        labels=pot_labels,
+        values=pot_values,
+        hole=0.4,
+        marker=dict(colors=PALETTE[:len(pot_labels)]),
+        textinfo='percent+label',
+        textposition='inside',
+        hovertemplate='<b>%{label}</b><br>%{value:.1f} kW<br>%{percent}<extra></extra>'
+    ))
+    fig3.update_layout(
+        title='⚡ Potencia DC por Inversor',
+        title_font_color=COLOR_PRIMARY,
+        paper_bgcolor='white',
+        height=350,
+        margin=dict(t=50, b=40),
+        legend=dict(orientation='v', x=1, y=0.5)
+    )
+    return fig3
+
+
+def figura_fechas(progreso: pd.DataFrame) -> go.Figure:
+    """Gráfico 4: Paneles por Fecha"""
+    # Convertir fechas a string para evitar interpretación como datetime
+    fecha_labels = fecha_texto(progreso['Fecha'])
+    paneles_vals = [int(v) for v in progreso['Paneles del Día'].tolist()]
+    fig4 = go.Figure(go.Bar(
+        x=fecha_labels,
+        y=paneles_vals,
+        text=paneles_vals,
+        texttemplate='%{text:,}',
+        textposition='outside',
+        marker_color=COLOR_TEAL,
+        marker_line_color=COLOR_TEAL,
+        marker_line_width=2,
+    ))
+    fig4.update_layout(
+        title='🎯 Paneles Limpiados por Fecha',
+        title_font_color=COLOR_PRIMARY,
+        plot_bgcolor='white', paper_bgcolor='white',
+        showlegend=False,
+        height=350,
+        margin=dict(t=50, b=40),
+        xaxis=dict(title='Fecha', type='category'),
+        yaxis=dict(
+            title='Paneles',
+            range=[0, max(paneles_vals) * 1.2]
+        )
+    )
+    return fig4
+
+
+# ─────────────────────────────────────────────
+# PIPELINE DE GRÁFICOS (CONSTRUCCIÓN Y SERIALIZACIÓN EN PARALELO)
+# ─────────────────────────────────────────────
+# En el dashboard los 4 gráficos se construyen y serializan en un pool de hilos
+# del proceso; en modo batch (varias plantas) cada planta va a un proceso aparte.
+# La serialización usa orjson si está instalado. Con una sola CPU los hilos solo
+# agregan overhead, así que se trabaja en secuencia.
+
+MOTOR_JSON = 'orjson' if importlib.util.find_spec('orjson') else 'json'
+HILOS_GRAFICOS = min(4, os.cpu_count() or 1)
+
+
+@st.cache_resource
+def pool_graficos() -> ThreadPoolExecutor:
+    """Pool de hilos único del proceso para construir y serializar gráficos"""
+    return ThreadPoolExecutor(max_workers=HILOS_GRAFICOS, thread_name_prefix='graficos')
+
+
+def construir_figuras(df: pd.DataFrame, progreso: pd.DataFrame, paralelo: bool = True) -> tuple:
+    """Construye los 4 gráficos del dashboard (sin dibujarlos)"""
+    tareas = [(figura_trackers, df), (figura_progreso, progreso), (figura_potencia, df), (figura_fechas, progreso)]
+    if not paralelo or HILOS_GRAFICOS == 1:
+        return tuple(funcion(datos) for funcion, datos in tareas)
+    pool = pool_graficos()
+    return tuple(f.result() for f in [pool.submit(funcion, datos) for funcion, datos in tareas])
+
+
+def figura_a_div(fig, height: int = 300) -> str:
+    """Div HTML embebible de una figura (requiere plotly.js cargado en la página)"""
+    if fig is None:
+        return ''
+    fig.update_layout(
+        height=height,
+        margin=dict(t=40, b=30, l=30, r=30),
+        paper_bgcolor='white',
+        plot_bgcolor='white',
+    )
+    # '</' escapado para que ningún texto del gráfico pueda cerrar el <script>
+    figura = pio.to_json(fig, validate=False, engine=MOTOR_JSON).replace('</', '<\\/')
+    div_id = f'graf-{uuid.uuid4().hex[:12]}'
+    return (
+        f'<div id="{div_id}" class="plotly-graph-div" style="height:{height}px; width:100%;"></div>'
+        f'<script>(function(){{var f={figura};'
+        f'Plotly.newPlot("{div_id}", f.data, f.layout, {{displayModeBar: false, responsive: true}});}})();</script>'
+    )
+
+
+def figuras_a_divs(figs, height: int = 300, paralelo: bool = True) -> list:
+    """Serializa varias figuras a divs (en el pool de hilos si `paralelo`)"""
+    if not paralelo or HILOS_GRAFICOS == 1:
+        return [figura_a_div(fig, height) for fig in figs]
+    return list(pool_graficos().map(lambda fig: figura_a_div(fig, height), figs))
+
+
+def graficos_planta(nombre: str, registro: pd.DataFrame, progreso: pd.DataFrame) -> tuple:
+    """Tarea batch (un proceso por planta): construye y serializa sus 4 gráficos"""
+    figs = construir_figuras(registro, progreso, paralelo=False)
+    return nombre, figuras_a_divs(figs, paralelo=False), sum(fig is not None for fig in figs)
+
+
+def graficos_plantas(datasets: dict, procesos: int = None) -> tuple:
+    """Modo batch: divs de los 4 gráficos de cada planta en un pool de procesos
+
+    Retorna ({planta: [div1..div4]}, métricas) con gráficos/segundo del lote.
+    """
+    inicio = time.perf_counter()
+    divs, n_figuras = {}, 0
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = [pool.submit(graficos_planta, nombre, data['registro'], data['progreso'])
+                   for nombre, data in datasets.items()]
+        for futuro in as_completed(futuros):
+            nombre, divs_planta, n = futuro.result()
+            divs[nombre] = divs_planta
+            n_figuras += n
+    segundos = time.perf_counter() - inicio
+    return divs, {
+        'plantas': len(divs),
+        'figuras': n_figuras,
+        'segundos': round(segundos, 3),
+        'figuras_por_segundo': round(n_figuras / segundos, 1) if segundos else None,
+    }
+
+
 def render_charts(df: pd.DataFrame, progreso: pd.DataFrame):
     """Renderiza los 4 gráficos y retorna las figuras para PDF"""
-    
-    # ── Colores de marca ──────────────────────
-    COLOR_PRIMARY   = '#667eea'
-    COLOR_SECONDARY = '#764ba2'
-    COLOR_TEAL      = '#4ecdc4'
-    COLOR_RED       = '#ff6b6b'
-    PALETTE = [COLOR_PRIMARY, COLOR_SECONDARY, COLOR_TEAL, COLOR_RED,
-               '#a29bfe', '#fd79a8', '#00cec9', '#fdcb6e']
+    figs = construir_figuras(df, progreso)
+    for fila in (figs[:2], figs[2:]):
+        for col, fig in zip(st.columns(2), fila):
+            with col:
+                st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+                if fig is not None:
+                    st.plotly_chart(fig, use_container_width=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+    return figs
+
+
+def render_pronostico(pronostico: dict, progreso: pd.DataFrame):
+    """Renderiza el pronóstico de término del ciclo actual con su banda"""
+    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+    st.markdown(f"### 🔮 Pronóstico de Término — Ciclo {pronostico['ciclo']}")
 
-    col1, col2 = st.columns(2)
+    def fmt(f):
+        return f.strftime('%d/%m/%Y') if f is not None else '—'
 
-    # ── Gráfico 1: Paneles por Tracker ────────
-    with col1:
-        st.markdown('<div class="chart-card">', unsafe_allow_html=True)
-        tracker_data = df.groupby('Tracker')['Paneles Limpiados'].sum().reset_index().sort_values('Tracker')
-        # Convertir a tipos nativos Python para evitar problemas con numpy.int64
-        t_labels = tracker_data['Tracker'].tolist()
-        t_values = [int(v) for v in tracker_data['Paneles Limpiados'].tolist()]
-        fig1 = go.Figure(go.Bar(
-            x=t_labels,
-            y=t_values,
-            marker_color=COLOR_PRIMARY,
-            marker_line_color=COLOR_PRIMARY,
-            hovertemplate='<b>%{x}</b><br>Paneles: %{y:,}<extra></extra>'
+    ritmo = pronostico['ritmo']
+    col1, col2, col3, col4 = st.columns(4)
+    for col, label, value, sub in [
+        (col1, 'Rendimiento Reciente', f"{pronostico['rendimiento']:,.0f}", 'Paneles/día (últimos 7 días)'),
+        (col2, 'Ritmo de Avance',      f'{ritmo:.2f}%' if ritmo is not None else '—', 'Por día corrido'),
+        (col3, 'Término Estimado',     fmt(pronostico['fecha_estimada']), 'Tendencia robusta'),
+        (col4, 'Rango',                fmt(pronostico['fecha_optimista']), f"a {fmt(pronostico['fecha_pesimista'])}"),
+    ]:
+        with col:
+            st.markdown(f"""
+            <div class="kpi-card">
+                <div class="kpi-label">{label}</div>
+                <div class="kpi-value" style="font-size:1.6em;">{value}</div>
+                <div class="kpi-sub">{sub}</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+    proyeccion = pronostico['proyeccion']
+    if proyeccion is not None:
+        actual = progreso[progreso['Ciclo'] == pronostico['ciclo']] if 'Ciclo' in progreso.columns else progreso
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=fecha_texto(proyeccion['Fecha']), y=proyeccion['Alto'].tolist(),
+            mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'
         ))
-        fig1.update_layout(
-            title='📊 Paneles Limpiados por Tracker',
-            plot_bgcolor='white', paper_bgcolor='white',
-            title_font_color=COLOR_PRIMARY,
-            showlegend=False,
-            xaxis=dict(tickangle=-45, type='category'),
-            height=350,
-            margin=dict(t=50, b=60)
-        )
-        st.plotly_chart(fig1, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    # ── Gráfico 2: Progreso acumulado ─────────
-    with col2:
-        st.markdown('<div class="chart-card">', unsafe_allow_html=True)
-        # Convertir fechas a string YYYY-MM-DD y valores a float nativo
-        prog_labels = [str(f) for f in progreso['Fecha'].tolist()]
-        prog_values = [float(v) for v in progreso['% Avance'].tolist()]
-        prog_acum   = [int(v) for v in progreso['Paneles Acumulados'].tolist()]
-        prog_dia    = [int(v) for v in progreso['Paneles del Día'].tolist()]
-        fig2 = go.Figure()
-        fig2.add_trace(go.Scatter(
-            x=prog_labels,
-            y=prog_values,
-            mode='lines+markers',
-            fill='tozeroy',
-            line=dict(color=COLOR_SECONDARY, width=3),
-            marker=dict(size=10, color=COLOR_SECONDARY),
-            customdata=list(zip(prog_acum, prog_dia)),
-            hovertemplate=(
-                '<b>%{x}</b><br>'
-                'Avance: %{y:.2f}%<br>'
-                'Acumulado: %{customdata[0]:,} paneles<br>'
-                'Hoy: %{customdata[1]:,} paneles<extra></extra>'
-            )
+        fig.add_trace(go.Scatter(
+            x=fecha_texto(proyeccion['Fecha']), y=proyeccion['Bajo'].tolist(),
+            mode='lines', line=dict(width=0), fill='tonexty',
+            fillcolor='rgba(102,126,234,0.15)', name='Banda 10–90%', hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=fecha_texto(actual['Fecha']), y=[float(v) for v in actual['% Avance'].tolist()],
+            mode='lines+markers', line=dict(color='#764ba2', width=3), name='Real'
+        ))
+        fig.add_trace(go.Scatter(
+            x=fecha_texto(proyeccion['Fecha']), y=proyeccion['Estimado'].tolist(),
+            mode='lines', line=dict(color='#667eea', width=2, dash='dash'), name='Proyección'
         ))
-        fig2.update_layout(
-            title='📈 Progreso Acumulado por Fecha',
-            title_font_color=COLOR_PRIMARY,
+        fig.update_layout(
             plot_bgcolor='white', paper_bgcolor='white',
             yaxis=dict(range=[0, 105], ticksuffix='%'),
-            xaxis=dict(type='category'),   # ← clave: categoría, no datetime
-            height=350,
-            margin=dict(t=50, b=40)
+            height=300, margin=dict(t=20, b=40),
+            legend=dict(orientation='h', y=-0.2)
         )
-        st.plotly_chart(fig2, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.plotly_chart(fig, use_container_width=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
-    col3, col4 = st.columns(2)
 
-    # ── Gráfico 3: Potencia por Inversor ──────
-    with col3:
-        st.markdown('<div class="chart-card">', unsafe_allow_html=True)
-        if 'Potencia DC Asociada' in df.columns:
-            pot_data = df.groupby('Inversor')['Potencia DC Asociada'].sum().reset_index()
-            # Convertir a tipos nativos Python
-            pot_labels = pot_data['Inversor'].tolist()
-            pot_values = [float(v) for v in pot_data['Potencia DC Asociada'].tolist()]
-            fig3 = go.Figure(go.Pie(
-                labels=pot_labels,
-                values=pot_values,
-                hole=0.4,
-                marker=dict(colors=PALETTE[:len(pot_labels)]),
-                textinfo='percent+label',
-                textposition='inside',
-                hovertemplate='<b>%{label}</b><br>%{value:.1f} kW<br>%{percent}<extra></extra>'
-            ))
-            fig3.update_layout(
-                title='⚡ Potencia DC por Inversor',
-                title_font_color=COLOR_PRIMARY,
-                paper_bgcolor='white',
-                height=350,
-                margin=dict(t=50, b=40),
-                legend=dict(orientation='v', x=1, y=0.5)
-            )
-            st.plotly_chart(fig3, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+def render_heatmap(matriz: dict):
+    """Renderiza el heatmap tracker × día (en teselas si la planta es grande)"""
+    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+    st.markdown("### 🗓️ Limpieza por Tracker y Día")
+
+    z, filas, cols, paso_f, paso_c = matriz_en_bloques(matriz)
+    if paso_f > 1 or paso_c > 1:
+        st.caption(f"Vista agregada: cada celda suma {paso_f} tracker(s) × {paso_c} día(s) "
+                   f"de {len(matriz['trackers']):,} trackers y {len(matriz['fechas']):,} días")
+
+    fig = go.Figure(go.Heatmap(
+        z=np.where(z > 0, z, np.nan).tolist(),
+        x=cols,
+        y=filas,
+        colorscale=[[0, '#e0e4fb'], [0.5, '#667eea'], [1, '#764ba2']],
+        colorbar=dict(title='Paneles'),
+        hovertemplate='<b>%{y}</b><br>%{x}<br>Paneles: %{z:,.0f}<extra></extra>',
+        hoverongaps=False,
+    ))
+    fig.update_layout(
+        plot_bgcolor='white', paper_bgcolor='white',
+        xaxis=dict(type='category', tickangle=-45),
+        yaxis=dict(type='category', autorange='reversed'),
+        height=max(350, min(900, 14 * len(filas))),
+        margin=dict(t=20, b=80)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
-    # ── Gráfico 4: Paneles por Fecha ──────────
-    with col4:
-        st.markdown('<div class="chart-card">', unsafe_allow_html=True)
-        # Convertir fechas a string para evitar interpretación como datetime
-        fecha_labels = [str(f) for f in progreso['Fecha']]
-        paneles_vals = progreso['Paneles del Día'].tolist()
-        fig4 = go.Figure(go.Bar(
-            x=fecha_labels,
-            y=paneles_vals,
-            text=paneles_vals,
-            texttemplate='%{text:,}',
-            textposition='outside',
-            marker_color=COLOR_TEAL,
-            marker_line_color=COLOR_TEAL,
-            marker_line_width=2,
-        ))
-        fig4.update_layout(
-            title='🎯 Paneles Limpiados por Fecha',
-            title_font_color=COLOR_PRIMARY,
-            plot_bgcolor='white', paper_bgcolor='white',
-            showlegend=False,
-            height=350,
-            margin=dict(t=50, b=40),
-            xaxis=dict(title='Fecha', type='category'),
-            yaxis=dict(
-                title='Paneles',
-                range=[0, max(paneles_vals) * 1.2]
-            )
-        )
-        st.plotly_chart(fig4, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
 
-    return fig1, fig2, fig3, fig4
+def render_cobertura(cobertura: dict):
+    """Renderiza el avance del ciclo actual y lo pendiente por Inversor / CBOX"""
+    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+    st.markdown("### 🧭 Cobertura de Planta")
+
+    ciclo     = len(cobertura['limpio'])
+    avance    = avance_ciclo(cobertura, ciclo)
+    pendiente = trackers_pendientes(cobertura, ciclo)
+    total     = len(cobertura['tabla'])
+
+    col1, col2, col3 = st.columns(3)
+    for col, label, value, sub in [
+        (col1, 'Ciclo Actual',      f'{ciclo}',                 'Ronda de limpieza'),
+        (col2, '% Avance del Ciclo', f'{avance:.1f}%',          'Según BASE_DATOS'),
+        (col3, 'Pendientes',        f'{len(pendiente):,}',      f'de {total:,} unidades'),
+    ]:
+        with col:
+            st.markdown(f"""
+            <div class="kpi-card">
+                <div class="kpi-label">{label}</div>
+                <div class="kpi-value">{value}</div>
+                <div class="kpi-sub">{sub}</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    col_inv, col_cbox = st.columns(2)
+    with col_inv:
+        st.dataframe(pendientes_por(cobertura, 'Inversor', ciclo), use_container_width=True, hide_index=True)
+    with col_cbox:
+        st.dataframe(pendientes_por(cobertura, 'CBOX', ciclo), use_container_width=True, hide_index=True)
+
+    with st.expander(f"Ver unidades pendientes ({len(pendiente):,})"):
+        st.dataframe(pendiente, use_container_width=True, hide_index=True, height=300)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def render_ciclos(ciclos: pd.DataFrame):
+    """Renderiza la tabla de avance, duración y rendimiento por ciclo"""
+    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+    st.markdown("### 🔁 Ciclos de Limpieza")
+    df_display = ciclos.copy()
+    df_display['Inicio'] = df_display['Inicio'].dt.strftime('%Y-%m-%d')
+    df_display['Fin'] = df_display['Fin'].dt.strftime('%Y-%m-%d')
+    df_display['% Avance'] = df_display['% Avance'].map('{:.1f}%'.format)
+    st.dataframe(df_display, use_container_width=True, hide_index=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
 
 def render_table(df: pd.DataFrame, base: pd.DataFrame):
@@ -426,7 +1575,7 @@ def render_table(df: pd.DataFrame, base: pd.DataFrame):
         display_cols.append('Potencia DC Asociada')
 
     df_display = df[display_cols].copy()
-    df_display['Fecha'] = df_display['Fecha'].astype(str)
+    df_display['Fecha'] = df_display['Fecha'].dt.strftime('%Y-%m-%d')
 
     if '% Avance' in df_display.columns:
         df_display['% Avance'] = (df_display['% Avance'] * 100).map('{:.0f}%'.format)
@@ -557,8 +1706,8 @@ def generar_excel(df: pd.DataFrame, progreso: pd.DataFrame, planta: str) -> byte
 
     for i, (_, row) in enumerate(progreso.iterrows(), 9):
         ws1.row_dimensions[i].height = 20
-        vals = [str(row['Fecha']), row['Paneles del Día'],
-                row['Paneles Acumulados'], f"{row['% Avance']:.2f}%"]
+        vals = [f"{row['Fecha']:%Y-%m-%d}", int(row['Paneles del Día']),
+                int(row['Paneles Acumulados']), f"{row['% Avance']:.2f}%"]
         bg = GRAY_LIGHT if i % 2 == 0 else WHITE
         for j, val in enumerate(vals, 1):
             c = ws1.cell(row=i, column=j, value=val)
@@ -601,8 +1750,10 @@ def generar_excel(df: pd.DataFrame, progreso: pd.DataFrame, planta: str) -> byte
         bg = GRAY_LIGHT if i % 2 == 0 else WHITE
         for j, col in enumerate(available, 1):
             val = row[col]
-            if col == 'Fecha':
-                val = str(val)
+            if pd.isna(val):
+                val = None
+            elif col == 'Fecha':
+                val = f"{val:%Y-%m-%d}"
             elif col == '% Avance':
                 val = f"{float(val)*100:.0f}%"
             elif col == 'Potencia DC Asociada':
@@ -631,7 +1782,7 @@ def generar_excel(df: pd.DataFrame, progreso: pd.DataFrame, planta: str) -> byte
     t3.alignment = center_align
     ws3.row_dimensions[1].height = 35
 
-    inv_grp = df.groupby('Inversor').agg(
+    inv_grp = df.groupby('Inversor', observed=True).agg(
         Trackers    = ('Tracker', 'nunique'),
         Paneles     = ('Paneles Limpiados', 'sum'),
         Strings     = ('Strings', 'sum') if 'Strings' in df.columns else ('Paneles Limpiados', 'count'),
@@ -667,50 +1818,220 @@ def generar_excel(df: pd.DataFrame, progreso: pd.DataFrame, planta: str) -> byte
     return buf.getvalue()
 
 
+# ─────────────────────────────────────────────
+# EXCEL CONSOLIDADO MULTI-PLANTA
+# ─────────────────────────────────────────────
+# Libro en modo write_only: cada hoja se escribe por streaming a disco, así la
+# memoria queda acotada a una planta a la vez (las plantas pueden venir de un
+# generador que las carga de a una). Los estilos se registran una sola vez por
+# libro como NamedStyle y las celdas solo referencian su nombre.
+
+MAX_FILAS_HOJA = 1_048_576 - 2   # límite de Excel menos título y encabezado
+FILAS_BLOQUE   = 50_000          # filas convertidas a valores Python por vez
+
+_BORDE_EXCEL = Border(*(Side(style='thin', color='DEE2E6'),) * 4)
+ESTILOS_EXCEL = {
+    'titulo':     dict(font=Font(name='Segoe UI', bold=True, color='FFFFFF', size=14),
+                       fill=PatternFill('solid', fgColor='764BA2'),
+                       alignment=Alignment(horizontal='left', vertical='center')),
+    'encabezado': dict(font=Font(name='Segoe UI', bold=True, color='FFFFFF', size=11),
+                       fill=PatternFill('solid', fgColor='667EEA'),
+                       alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+                       border=_BORDE_EXCEL),
+    'celda':      dict(font=Font(name='Segoe UI', size=10),
+                       alignment=Alignment(horizontal='center', vertical='center'),
+                       border=_BORDE_EXCEL),
+    'fecha':      dict(font=Font(name='Segoe UI', size=10),
+                       alignment=Alignment(horizontal='center', vertical='center'),
+                       border=_BORDE_EXCEL, number_format='yyyy-mm-dd'),
+    'porcentaje': dict(font=Font(name='Segoe UI', bold=True, size=10),
+                       alignment=Alignment(horizontal='center', vertical='center'),
+                       border=_BORDE_EXCEL, number_format='0.00"%"'),
+}
+
+# Detalle por planta: columna del registro → (encabezado, ancho)
+COLUMNAS_CONSOLIDADO = {
+    'Fecha':                ('Fecha', 12),
+    'Ciclo':                ('Ciclo', 8),
+    'Inversor':             ('Inversor', 14),
+    'CBOX':                 ('CBOX', 14),
+    'Tracker':              ('Tracker', 16),
+    'Paneles Limpiados':    ('Paneles Limpiados', 18),
+    'Strings':              ('Strings', 10),
+    'Potencia DC Asociada': ('Potencia DC (kW)', 16),
+}
+
+
+def registrar_estilos(wb: Workbook):
+    """Agrega al libro los estilos de ESTILOS_EXCEL (una vez por libro)"""
+    for nombre, spec in ESTILOS_EXCEL.items():
+        estilo = NamedStyle(name=nombre)
+        for atributo, valor in spec.items():
+            setattr(estilo, atributo, valor)
+        wb.add_named_style(estilo)
+
+
+def _celdas(ws, valores, estilos) -> list:
+    """Fila de celdas write_only; `estilos` es un estilo registrado o uno por columna
+
+    Columnas con estilo None se escriben como valor simple: en filas de datos
+    solo las fechas necesitan estilo (formato de número), y así se ahorra crear
+    una celda estilada por valor.
+    """
+    if isinstance(estilos, str):
+        estilos = [estilos] * len(valores)
+    fila = []
+    for valor, estilo in zip(valores, estilos):
+        if estilo is None:
+            fila.append(valor)
+            continue
+        celda = WriteOnlyCell(ws, value=valor)
+        celda.style = estilo
+        fila.append(celda)
+    return fila
+
+
+def _valores_columna(serie: pd.Series) -> list:
+    """Columna → lista de valores Python aptos para openpyxl (NA → None)"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return [None if pd.isna(v) else v for v in serie.dt.to_pydatetime()]
+    if pd.api.types.is_float_dtype(serie):
+        serie = serie.astype('float64').round(2)
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def _nombre_hoja(nombre: str, usados: set) -> str:
+    """Nombre de hoja válido (≤31 caracteres, sin []:*?/\\) y único en el libro"""
+    base = ''.join('_' if ch in '[]:*?/\\' else ch for ch in str(nombre))[:31] or 'Planta'
+    candidato, n = base, 2
+    while candidato.lower() in usados:
+        sufijo = f' ({n})'
+        candidato, n = base[:31 - len(sufijo)] + sufijo, n + 1
+    usados.add(candidato.lower())
+    return candidato
+
+
+def resumen_planta(nombre: str, data: dict) -> list:
+    """Fila de la hoja resumen para una planta"""
+    df = data['registro']
+    p = pronosticar_termino(data['progreso'])
+    return [
+        nombre,
+        len(df),
+        int(df['Tracker'].nunique()),
+        df['Fecha'].min().to_pydatetime() if len(df) else None,
+        df['Fecha'].max().to_pydatetime() if len(df) else None,
+        int(df['Paneles Limpiados'].sum()),
+        int(data['capacidad']) if data.get('capacidad') else None,
+        p['ciclo'],
+        round(float(p['avance']), 2),
+        pd.Timestamp(p['fecha_estimada']).to_pydatetime() if p['fecha_estimada'] is not None else None,
+    ]
+
+
+def escribir_detalle(wb: Workbook, planta: str, df: pd.DataFrame, usados: set) -> int:
+    """Escribe el registro de una planta por bloques; si excede una hoja continúa en otra"""
+    columnas = [c for c in COLUMNAS_CONSOLIDADO if c in df.columns]
+    estilos = ['fecha' if c == 'Fecha' else None for c in columnas]
+    encabezados = [COLUMNAS_CONSOLIDADO[c][0] for c in columnas]
+    hojas = 0
+
+    for inicio_hoja in range(0, max(len(df), 1), MAX_FILAS_HOJA):
+        hojas += 1
+        ws = wb.create_sheet(_nombre_hoja(planta if hojas == 1 else f'{planta} ({hojas})', usados))
+        ws.sheet_view.showGridLines = False
+        ws.freeze_panes = 'A3'
+        for i, c in enumerate(columnas, 1):
+            ws.column_dimensions[get_column_letter(i)].width = COLUMNAS_CONSOLIDADO[c][1]
+        ws.append(_celdas(ws, [f'Detalle de Registros — Planta {planta}'], 'titulo'))
+        ws.append(_celdas(ws, encabezados, 'encabezado'))
+
+        fin_hoja = min(inicio_hoja + MAX_FILAS_HOJA, len(df))
+        for inicio in range(inicio_hoja, fin_hoja, FILAS_BLOQUE):
+            bloque = df.iloc[inicio:min(inicio + FILAS_BLOQUE, fin_hoja)]
+            for fila in zip(*(_valores_columna(bloque[c]) for c in columnas)):
+                ws.append(_celdas(ws, fila, estilos))
+    return hojas
+
+
+def generar_excel_consolidado(plantas, destino=None) -> bytes:
+    """Excel con una hoja resumen de todas las plantas y una hoja de detalle por planta
+
+    `plantas` es un dict o un iterable de (nombre, salida de load_excel); puede ser
+    un generador para cargar de a una planta. Con `destino` (ruta o archivo) el
+    libro se guarda ahí; si no, se retornan los bytes.
+    """
+    wb = Workbook(write_only=True)
+    registrar_estilos(wb)
+    usados = set()
+
+    # La hoja resumen se crea primero (queda primera) y se llena al final
+    resumen = wb.create_sheet(_nombre_hoja('Resumen Plantas', usados))
+    resumen.sheet_view.showGridLines = False
+    encabezados = ['Planta', 'Registros', 'Trackers', 'Inicio', 'Fin', 'Paneles Limpiados',
+                   'Capacidad (Paneles)', 'Ciclo Actual', '% Avance Ciclo', 'Término Estimado']
+    for i, ancho in enumerate([20, 12, 10, 12, 12, 18, 18, 12, 14, 16], 1):
+        resumen.column_dimensions[get_column_letter(i)].width = ancho
+
+    filas = []
+    for nombre, data in (plantas.items() if isinstance(plantas, dict) else plantas):
+        if not data:
+            continue
+        escribir_detalle(wb, nombre, data['registro'], usados)
+        filas.append(resumen_planta(nombre, data))
+
+    resumen.append(_celdas(resumen, [f'INFORME CONSOLIDADO DE LIMPIEZA — {len(filas)} PLANTAS'], 'titulo'))
+    resumen.append(_celdas(resumen, [f'Fecha de emisión: {date.today().strftime("%d/%m/%Y")}'], 'celda'))
+    resumen.append(_celdas(resumen, encabezados, 'encabezado'))
+    estilos = ['celda', 'celda', 'celda', 'fecha', 'fecha', 'celda', 'celda', 'celda', 'porcentaje', 'fecha']  # pocas filas: todas estiladas
+    for fila in filas:
+        resumen.append(_celdas(resumen, fila, estilos))
+    if filas:
+        totales = ['TOTAL', sum(f[1] for f in filas), sum(f[2] for f in filas), None, None,
+                   sum(f[5] for f in filas), sum(f[6] or 0 for f in filas), None, None, None]
+        resumen.append(_celdas(resumen, totales, 'encabezado'))
+
+    if destino is not None:
+        wb.save(destino)
+        return None
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
 def generar_pdf_html(df: pd.DataFrame, progreso: pd.DataFrame,
                      planta: str,
                      fig_trackers, fig_progreso,
-                     fig_potencia, fig_fecha) -> str:
-    """Genera HTML con gráficos Plotly embebidos — funciona sin kaleido"""
+                     fig_potencia, fig_fecha, divs: list = None) -> str:
+    """Genera HTML con gráficos Plotly embebidos — funciona sin kaleido
+
+    `divs` permite pasar los 4 gráficos ya serializados (modo batch).
+    """
 
     total_paneles  = int(df['Paneles Limpiados'].sum())
     total_strings  = int(df['Strings'].sum()) if 'Strings' in df.columns else 0
     max_avance     = float(progreso['% Avance'].max()) if len(progreso) > 0 else 0.0
     total_potencia = float(df['Potencia DC Asociada'].sum()) if 'Potencia DC Asociada' in df.columns else 0.0
 
-    # Convertir cada figura a HTML div embebible (sin kaleido, solo JS)
-    def fig_to_div(fig, height=300):
-        fig_copy = fig
-        fig_copy.update_layout(
-            height=height,
-            margin=dict(t=40, b=30, l=30, r=30),
-            paper_bgcolor='white',
-            plot_bgcolor='white',
-        )
-        return fig_copy.to_html(
-            full_html=False,
-            include_plotlyjs=False,   # se carga una sola vez abajo
-            config={'displayModeBar': False}
-        )
-
-    div1 = fig_to_div(fig_trackers)
-    div2 = fig_to_div(fig_progreso)
-    div3 = fig_to_div(fig_potencia)
-    div4 = fig_to_div(fig_fecha)
+    # Convertir cada figura a HTML div embebible (sin kaleido, solo JS; plotly.js se carga una sola vez abajo)
+    if divs is None:
+        divs = figuras_a_divs([fig_trackers, fig_progreso, fig_potencia, fig_fecha])
+    div1, div2, div3, div4 = divs
 
     # Filas de tabla
     table_rows = ''
     for i, (_, r) in enumerate(df.iterrows()):
         bg = '#f8f9ff' if i % 2 == 0 else 'white'
-        avance   = f"{float(r.get('% Avance', 0))*100:.0f}%"
-        potencia = f"{float(r.get('Potencia DC Asociada', 0)):.1f}"
-        strings  = int(r['Strings']) if 'Strings' in df.columns else '-'
+        avance   = f"{float(r.get('% Avance', 0))*100:.0f}%" if pd.notna(r.get('% Avance', 0)) else '-'
+        potencia = f"{float(r.get('Potencia DC Asociada', 0)):.1f}" if pd.notna(r.get('Potencia DC Asociada', 0)) else '-'
+        strings  = int(r['Strings']) if 'Strings' in df.columns and pd.notna(r['Strings']) else '-'
+        paneles  = f"{int(r['Paneles Limpiados']):,}" if pd.notna(r['Paneles Limpiados']) else '-'
         table_rows += f"""
         <tr style="background:{bg};">
-            <td>{r['Fecha']}</td>
+            <td>{r['Fecha']:%Y-%m-%d}</td>
             <td>{r['Tracker']}</td>
             <td>{r['Inversor']}</td>
-            <td>{int(r['Paneles Limpiados']):,}</td>
+            <td>{paneles}</td>
             <td>{strings}</td>
             <td>{avance}</td>
             <td>{potencia} kW</td>
@@ -718,7 +2039,7 @@ def generar_pdf_html(df: pd.DataFrame, progreso: pd.DataFrame,
 
     # Filas de progreso
     prog_rows = ''.join(
-        f"<tr><td>{r['Fecha']}</td>"
+        f"<tr><td>{r['Fecha']:%Y-%m-%d}</td>"
         f"<td>{int(r['Paneles del Día']):,}</td>"
         f"<td>{int(r['Paneles Acumulados']):,}</td>"
         f"<td>{r['% Avance']:.2f}%</td></tr>"
@@ -900,51 +2221,968 @@ def generar_pdf_html(df: pd.DataFrame, progreso: pd.DataFrame,
     return html
 
 
+def agregar_para_html(df: pd.DataFrame) -> dict:
+    """Pre-agrega Fecha × Inversor × CBOX × Tracker (× Ciclo) en columnas codificadas para JS"""
+    dims = [c for c in ['Inversor', 'CBOX', 'Tracker'] if c in df.columns]
+    claves = ['Fecha'] + dims + (['Ciclo'] if 'Ciclo' in df.columns else [])
+    valores = {'Paneles Limpiados': 'p', 'Paneles Ciclo': 'pc', 'Strings': 's', 'Potencia DC Asociada': 'kw'}
+    cols = [c for c in valores if c in df.columns]
+
+    agg = df.groupby(claves, observed=True, dropna=False)[cols].sum().reset_index()
+
+    fechas = np.sort(agg['Fecha'].unique())
+    datos = {
+        'fechas': fecha_texto(fechas),
+        'f': np.searchsorted(fechas, agg['Fecha'].to_numpy()).tolist(),
+        'ciclo': agg['Ciclo'].astype(int).tolist() if 'Ciclo' in agg.columns else [1] * len(agg),
+    }
+    for col, clave in [('Inversor', 'i'), ('CBOX', 'c'), ('Tracker', 't')]:
+        if col in dims:
+            codigos, etiquetas = pd.factorize(agg[col].astype('string'), sort=True)
+            datos[clave] = codigos.tolist()
+            datos[col] = [str(e) for e in etiquetas]
+        else:
+            datos[clave] = [-1] * len(agg)
+            datos[col] = []
+    for col, clave in valores.items():
+        if col in cols:
+            serie = pd.to_numeric(agg[col], errors='coerce').fillna(0)
+            datos[clave] = (serie.astype(np.int64) if clave != 'kw' else serie.round(2)).tolist()
+        else:
+            datos[clave] = [0] * len(agg)
+    # Sin 'Paneles Ciclo' el avance del ciclo es todo lo limpiado
+    if 'Paneles Ciclo' not in cols:
+        datos['pc'] = datos['p']
+    return datos
+
+
+def generar_html_interactivo(df: pd.DataFrame, planta: str, capacidad: float = None) -> str:
+    """HTML autocontenido con filtros en la página: los 4 gráficos y KPIs se recalculan en el navegador
+
+    Embebe plotly.js y un dataset pre-agregado; no requiere red ni servidor.
+    """
+    datos = agregar_para_html(df)
+    datos['capacidad'] = float(capacidad) if capacidad else None
+    # Calculado aquí: Math.max(...D.ciclo) desborda la pila con cientos de miles de entradas
+    datos['n_ciclos'] = max(datos['ciclo'], default=1)
+
+    def opciones(valores):
+        return ''.join(f'<option value="{i}">{escape(v)}</option>' for i, v in enumerate(valores))
+
+    fechas_opts = opciones(datos['fechas'])
+    # '</' escapado para que ningún nombre pueda cerrar el <script>
+    datos_json = json.dumps(datos, separators=(',', ':')).replace('</', '<\\/')
+    ultimo = len(datos['fechas']) - 1
+
+    html = f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="UTF-8">
+<title>Informe Interactivo — Planta {planta}</title>
+<style>
+    * {{ margin:0; padding:0; box-sizing:border-box; }}
+    body {{ font-family:'Segoe UI',Arial,sans-serif; color:#333; background:#f4f6fb; }}
+    .header {{
+        background: linear-gradient(135deg,#667eea,#764ba2);
+        color: white; padding: 28px 35px; border-radius: 12px;
+        margin: 20px; text-align: center;
+    }}
+    .header h1 {{ font-size:26px; margin-bottom:6px; }}
+    .header p  {{ font-size:13px; opacity:.85; }}
+    .filtros {{
+        display: grid; grid-template-columns: 1fr 1fr 1fr 1fr; gap: 15px;
+        margin: 0 20px 20px; background: white; border-radius: 10px; padding: 15px;
+        box-shadow: 0 4px 12px rgba(0,0,0,.08);
+    }}
+    .filtros label {{ display:block; color:#667eea; font-size:11px; font-weight:600;
+                      text-transform:uppercase; margin-bottom:6px; }}
+    .filtros select {{ width:100%; font-size:12px; padding:4px; border:1px solid #dee2e6; border-radius:6px; }}
+    .filtros .rango select {{ margin-bottom:6px; }}
+    .filtros button {{ margin-top:6px; padding:6px 12px; border:none; border-radius:6px;
+                       background:#667eea; color:white; cursor:pointer; }}
+    .kpis {{ display:grid; grid-template-columns:repeat(4,1fr); gap:15px; margin:0 20px 20px; }}
+    .kpi {{
+        background: white; border-left: 5px solid #667eea; border-radius: 10px;
+        padding: 18px 14px; text-align: center; box-shadow: 0 4px 12px rgba(102,126,234,.15);
+    }}
+    .kpi .label {{ color:#888; font-size:10px; text-transform:uppercase; letter-spacing:1px;
+                   margin-bottom:8px; font-weight:600; }}
+    .kpi .value {{ color:#667eea; font-size:24px; font-weight:bold; }}
+    .charts-grid {{ display:grid; grid-template-columns:1fr 1fr; gap:15px; margin:0 20px 20px; }}
+    .chart-box {{ background:white; border-radius:10px; padding:15px; box-shadow:0 4px 12px rgba(0,0,0,.08); }}
+    .footer {{ margin:20px; text-align:center; color:#aaa; font-size:10px;
+               border-top:1px solid #ddd; padding-top:12px; }}
+</style>
+<script>{get_plotlyjs()}</script>
+</head>
+<body>
+
+<div class="header">
+    <h1>Informe Interactivo de Limpieza</h1>
+    <p>Planta {planta} &nbsp;·&nbsp; Generado el {date.today().strftime('%d/%m/%Y')}</p>
+</div>
+
+<div class="filtros">
+    <div class="rango">
+        <label>📅 Desde / Hasta</label>
+        <select id="f-desde">{fechas_opts}</select>
+        <select id="f-hasta">{fechas_opts}</select>
+    </div>
+    <div><label>🔌 Inversor</label><select id="f-inv" multiple size="6">{opciones(datos['Inversor'])}</select></div>
+    <div><label>📦 CBOX</label><select id="f-cbox" multiple size="6">{opciones(datos['CBOX'])}</select></div>
+    <div>
+        <label>🎯 Tracker</label><select id="f-trk" multiple size="6">{opciones(datos['Tracker'])}</select>
+        <button id="f-reset">🔄 Resetear filtros</button>
+    </div>
+</div>
+
+<div class="kpis">
+    <div class="kpi"><div class="label">Paneles Limpiados</div><div class="value" id="k-paneles">–</div></div>
+    <div class="kpi"><div class="label">Strings Limpiados</div><div class="value" id="k-strings">–</div></div>
+    <div class="kpi"><div class="label">% Avance Total</div><div class="value" id="k-avance">–</div></div>
+    <div class="kpi"><div class="label">Potencia DC Total</div><div class="value" id="k-potencia">–</div></div>
+</div>
+
+<div class="charts-grid">
+    <div class="chart-box"><div id="g-trackers"></div></div>
+    <div class="chart-box"><div id="g-progreso"></div></div>
+    <div class="chart-box"><div id="g-potencia"></div></div>
+    <div class="chart-box"><div id="g-fecha"></div></div>
+</div>
+
+<div class="footer">
+    Dashboard Limpieza en Seco · Sistema Universal de Control de Operaciones
+</div>
+
+<script>
+const D = {datos_json};
+document.getElementById('f-hasta').value = '{ultimo}';
+"""
+    html += """
+const PRIMARY = '#667eea', SECONDARY = '#764ba2', TEAL = '#4ecdc4';
+const PALETTE = [PRIMARY, SECONDARY, TEAL, '#ff6b6b', '#a29bfe', '#fd79a8', '#00cec9', '#fdcb6e'];
+const BASE = { plot_bgcolor: 'white', paper_bgcolor: 'white', title: { font: { color: PRIMARY } },
+               height: 320, margin: { t: 40, b: 60, l: 40, r: 20 } };
+const CONFIG = { displayModeBar: false, responsive: true };
+const fmt = v => Math.round(v).toLocaleString('en-US');
+
+function seleccion(id) {
+    return new Set(Array.from(document.getElementById(id).selectedOptions, o => +o.value));
+}
+
+function recalcular() {
+    const f0 = +document.getElementById('f-desde').value;
+    const f1 = +document.getElementById('f-hasta').value;
+    const si = seleccion('f-inv'), sc = seleccion('f-cbox'), st = seleccion('f-trk');
+    const nF = D.fechas.length, nC = Math.max(1, D.n_ciclos);
+
+    const porTracker = new Float64Array(D.Tracker.length);
+    const porInv = new Float64Array(D.Inversor.length);
+    const porDia = new Float64Array(nF);
+    const porDiaCiclo = new Float64Array(nF * (nC + 1));
+    const cicloDia = new Int32Array(nF);
+    let paneles = 0, strings = 0, kw = 0, cicloMin = Infinity;
+
+    for (let k = 0; k < D.p.length; k++) {
+        const f = D.f[k];
+        if (f < f0 || f > f1) continue;
+        if (si.size && !si.has(D.i[k])) continue;
+        if (sc.size && !sc.has(D.c[k])) continue;
+        if (st.size && !st.has(D.t[k])) continue;
+        const p = D.p[k], c = D.ciclo[k];
+        paneles += p; strings += D.s[k]; kw += D.kw[k];
+        if (D.t[k] >= 0) porTracker[D.t[k]] += p;
+        if (D.i[k] >= 0) porInv[D.i[k]] += D.kw[k];
+        porDia[f] += p;
+        porDiaCiclo[f * (nC + 1) + c] += D.pc[k];  // sin retrabajo: el avance no pasa de 100%
+        if (c > cicloDia[f]) cicloDia[f] = c;
+        if (c < cicloMin) cicloMin = c;
+    }
+
+    // Capacidad: la de la planta sin filtros de dimensión; si no, lo limpiado en el primer ciclo
+    let capacidad = D.capacidad;
+    if (!capacidad || si.size || sc.size || st.size) {
+        capacidad = 0;
+        for (let f = 0; f < nF; f++) capacidad += porDiaCiclo[f * (nC + 1) + cicloMin] || 0;
+    }
+
+    // Progreso: acumulado que se reinicia en cada ciclo
+    const acum = new Float64Array(nC + 1);
+    const dias = [], avance = [], acumDia = [], delDia = [];
+    for (let f = 0; f < nF; f++) {
+        if (!cicloDia[f]) continue;
+        for (let c = 1; c <= nC; c++) acum[c] += porDiaCiclo[f * (nC + 1) + c];
+        dias.push(D.fechas[f]);
+        acumDia.push(acum[cicloDia[f]]);
+        delDia.push(porDia[f]);
+        avance.push(capacidad ? Math.round(acum[cicloDia[f]] / capacidad * 10000) / 100 : 0);
+    }
+
+    document.getElementById('k-paneles').textContent = fmt(paneles);
+    document.getElementById('k-strings').textContent = fmt(strings);
+    document.getElementById('k-avance').textContent = (avance.length ? Math.max(...avance) : 0).toFixed(1) + '%';
+    document.getElementById('k-potencia').textContent = fmt(kw) + ' kW';
+
+    const tx = [], ty = [];
+    porTracker.forEach((v, t) => { if (v > 0) { tx.push(D.Tracker[t]); ty.push(v); } });
+    Plotly.react('g-trackers', [{ type: 'bar', x: tx, y: ty, marker: { color: PRIMARY },
+        hovertemplate: '<b>%{x}</b><br>Paneles: %{y:,}<extra></extra>' }],
+        { ...BASE, title: { ...BASE.title, text: '📊 Paneles Limpiados por Tracker' },
+          xaxis: { type: 'category', tickangle: -45 }, showlegend: false }, CONFIG);
+
+    Plotly.react('g-progreso', [{ type: 'scatter', mode: 'lines+markers', fill: 'tozeroy', x: dias, y: avance,
+        line: { color: SECONDARY, width: 3 }, marker: { size: 8, color: SECONDARY },
+        customdata: acumDia.map((a, j) => [a, delDia[j]]),
+        hovertemplate: '<b>%{x}</b><br>Avance: %{y:.2f}%<br>Acumulado: %{customdata[0]:,} paneles<br>Hoy: %{customdata[1]:,} paneles<extra></extra>' }],
+        { ...BASE, title: { ...BASE.title, text: '📈 Progreso Acumulado por Fecha' },
+          xaxis: { type: 'category' }, yaxis: { range: [0, 105], ticksuffix: '%' } }, CONFIG);
+
+    const px = [], py = [];
+    porInv.forEach((v, i) => { if (v > 0) { px.push(D.Inversor[i]); py.push(v); } });
+    Plotly.react('g-potencia', [{ type: 'pie', labels: px, values: py, hole: 0.4,
+        marker: { colors: PALETTE.slice(0, px.length) }, textinfo: 'percent+label', textposition: 'inside',
+        hovertemplate: '<b>%{label}</b><br>%{value:.1f} kW<br>%{percent}<extra></extra>' }],
+        { ...BASE, title: { ...BASE.title, text: '⚡ Potencia DC por Inversor' } }, CONFIG);
+
+    Plotly.react('g-fecha', [{ type: 'bar', x: dias, y: delDia, text: delDia, texttemplate: '%{text:,}',
+        textposition: 'outside', marker: { color: TEAL } }],
+        { ...BASE, title: { ...BASE.title, text: '🎯 Paneles Limpiados por Fecha' }, showlegend: false,
+          xaxis: { title: 'Fecha', type: 'category' },
+          yaxis: { title: 'Paneles', range: [0, Math.max(1, ...delDia) * 1.2] } }, CONFIG);
+}
+
+['f-desde', 'f-hasta', 'f-inv', 'f-cbox', 'f-trk'].forEach(id =>
+    document.getElementById(id).addEventListener('change', recalcular));
+document.getElementById('f-reset').addEventListener('click', () => {
+    document.getElementById('f-desde').value = '0';
+    document.getElementById('f-hasta').value = String(D.fechas.length - 1);
+    ['f-inv', 'f-cbox', 'f-trk'].forEach(id =>
+        Array.from(document.getElementById(id).options).forEach(o => { o.selected = false; }));
+    recalcular();
+});
+recalcular();
+</script>
+
+</body>
+</html>"""
+    return html
+
+
 # ─────────────────────────────────────────────
-# SIDEBAR: FILTROS Y CARGA DE ARCHIVO
+# HISTÓRICO LOCAL (SQLite)
 # ─────────────────────────────────────────────
+# Por defecto junto a app.py; LIMPIEZA_HISTORICO_DB permite otra ubicación.
+
+HISTORICO_DB = Path(os.environ.get('LIMPIEZA_HISTORICO_DB') or Path(__file__).with_name('historico_limpieza.db'))
+
+ESQUEMA_HISTORICO = """
+CREATE TABLE IF NOT EXISTS registros (
+    planta    TEXT    NOT NULL,
+    fecha     TEXT    NOT NULL,   -- 'YYYY-MM-DD'
+    tracker   TEXT    NOT NULL,
+    inversor  TEXT,
+    cbox      TEXT,
+    ciclo     INTEGER,
+    paneles   INTEGER NOT NULL DEFAULT 0,
+    strings   INTEGER,
+    potencia  REAL,
+    PRIMARY KEY (planta, fecha, tracker)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_registros_fecha    ON registros (fecha, planta);
+CREATE INDEX IF NOT EXISTS ix_registros_inversor ON registros (planta, inversor, fecha);
+CREATE INDEX IF NOT EXISTS ix_registros_cbox     ON registros (planta, cbox, fecha);
+CREATE TABLE IF NOT EXISTS cargas (
+    planta    TEXT NOT NULL,
+    cargado   TEXT NOT NULL,
+    filas     INTEGER NOT NULL,
+    desde     TEXT,
+    hasta     TEXT
+);
+"""
+
+# Granularidad → expresión SQL del período
+PERIODOS_SQL = {
+    'Día':    "fecha",
+    'Semana': "strftime('%Y-W%W', fecha)",
+    'Mes':    "strftime('%Y-%m', fecha)",
+}
+
+
+def conectar_historico(ruta=None) -> sqlite3.Connection:
+    """Abre (y crea si hace falta) la base histórica; WAL permite leer mientras se escribe"""
+    con = sqlite3.connect(str(ruta or HISTORICO_DB), timeout=30, check_same_thread=False)
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    con.executescript(ESQUEMA_HISTORICO)
+    return con
+
+
+def guardar_historico(df_reg: pd.DataFrame, planta: str, ruta=None) -> int:
+    """Upsert del registro normalizado, una fila por (planta, Fecha, Tracker); retorna filas escritas"""
+    if len(df_reg) == 0:
+        return 0
+    claves = ['Fecha', 'Tracker']
+    agg = {'Paneles Limpiados': 'sum'}
+    for col, fn in [('Inversor', 'first'), ('CBOX', 'first'), ('Ciclo', 'max'),
+                    ('Strings', 'sum'), ('Potencia DC Asociada', 'sum')]:
+        if col in df_reg.columns:
+            agg[col] = fn
+    # Un mismo tracker puede tener varias filas en el día: se consolidan antes del upsert
+    por_clave = df_reg.groupby(claves, observed=True).agg(agg).reset_index()
+
+    def columna(col, tipo=object):
+        if col not in por_clave.columns:
+            return [None] * len(por_clave)
+        serie = por_clave[col].astype(tipo) if tipo is not object else por_clave[col].astype('string')
+        return [None if pd.isna(v) else v for v in serie.tolist()]
+
+    filas = list(zip(
+        [planta] * len(por_clave),
+        por_clave['Fecha'].dt.strftime('%Y-%m-%d').tolist(),
+        columna('Tracker'), columna('Inversor'), columna('CBOX'),
+        columna('Ciclo', 'Int64'), columna('Paneles Limpiados', 'Int64'),
+        columna('Strings', 'Int64'), columna('Potencia DC Asociada', 'Float64'),
+    ))
+
+    con = conectar_historico(ruta)
+    try:
+        with con:
+            con.executemany("""
+                INSERT INTO registros (planta, fecha, tracker, inversor, cbox, ciclo, paneles, strings, potencia)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (planta, fecha, tracker) DO UPDATE SET
+                    inversor = excluded.inversor, cbox = excluded.cbox, ciclo = excluded.ciclo,
+                    paneles = excluded.paneles, strings = excluded.strings, potencia = excluded.potencia
+            """, filas)
+            con.execute(
+                "INSERT INTO cargas (planta, cargado, filas, desde, hasta) VALUES (?, datetime('now'), ?, ?, ?)",
+                (planta, len(filas), min(f[1] for f in filas), max(f[1] for f in filas))
+            )
+    finally:
+        con.close()
+    return len(filas)
 
-with st.sidebar:
-    st.markdown("""
-    <div style="text-align:center; padding: 20px 0 10px;">
-        <span style="font-size:2em;">⚡</span>
-        <h2 style="color:#667eea; margin:5px 0;">Limpieza</h2>
-        <p style="color:#888; font-size:0.85em;">Dashboard Universal</p>
-    </div>
-    <hr style="border-color:#eee; margin-bottom:20px;">
-    """, unsafe_allow_html=True)
 
-    st.markdown("### 📁 Cargar Archivo")
-    uploaded_file = st.file_uploader(
-        "Selecciona el Excel de limpieza",
-        type=['xlsx', 'xls'],
-        help="El archivo debe tener las hojas REGISTRO_DIARIO y BASE_DATOS"
-    )
+def plantas_historico(ruta=None) -> list:
+    """Plantas presentes en el histórico"""
+    con = conectar_historico(ruta)
+    try:
+        return [r[0] for r in con.execute("SELECT DISTINCT planta FROM registros ORDER BY planta")]
+    finally:
+        con.close()
+
+
+def consultar_historico(granularidad: str = 'Mes', plantas: list = None, desde=None, hasta=None,
+                        inversores: list = None, cboxes: list = None, ruta=None) -> pd.DataFrame:
+    """Agregados por planta y período calculados en SQLite (solo viaja el resultado)"""
+    periodo = PERIODOS_SQL[granularidad]
+    condiciones, params = [], []
+    for col, valores in [('planta', plantas), ('inversor', inversores), ('cbox', cboxes)]:
+        if valores:
+            condiciones.append(f"{col} IN ({','.join('?' * len(valores))})")
+            params.extend(valores)
+    if desde is not None:
+        condiciones.append("fecha >= ?")
+        params.append(pd.Timestamp(desde).strftime('%Y-%m-%d'))
+    if hasta is not None:
+        condiciones.append("fecha <= ?")
+        params.append(pd.Timestamp(hasta).strftime('%Y-%m-%d'))
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+
+    sql = f"""
+        SELECT planta                  AS Planta,
+               {periodo}               AS Periodo,
+               SUM(paneles)            AS "Paneles Limpiados",
+               SUM(strings)            AS Strings,
+               ROUND(SUM(potencia), 1) AS "Potencia DC (kW)",
+               COUNT(DISTINCT tracker) AS Trackers,
+               COUNT(DISTINCT fecha)   AS "Días Activos"
+        FROM registros
+        {where}
+        GROUP BY planta, Periodo
+        ORDER BY Periodo, planta
+    """
+    con = conectar_historico(ruta)
+    try:
+        return pd.read_sql_query(sql, con, params=params)
+    finally:
+        con.close()
 
-    st.markdown("---")
 
-    if uploaded_file:
-        st.markdown("### 🔍 Filtros")
+# ─────────────────────────────────────────────
+# ARCHIVO ARROW PARTICIONADO (PORTAFOLIO)
+# ─────────────────────────────────────────────
+# Un archivo Arrow IPC (Feather v2) sin comprimir por planta y mes:
+#   archivo_limpieza/planta=<nombre>/<YYYY-MM>.arrow
+# Las consultas descartan particiones por su ruta, abren las que quedan con
+# memory-map y leen solo las columnas pedidas: las columnas numéricas sin
+# nulos se usan directo desde el mapa, sin copiarlas a memoria.
+# La raíz es configurable con LIMPIEZA_ARCHIVO_ARROW.
+
+ARCHIVO_ARROW = Path(os.environ.get('LIMPIEZA_ARCHIVO_ARROW') or Path(__file__).with_name('archivo_limpieza'))
+COLUMNAS_ARCHIVO = ['Fecha', 'Tracker', 'Inversor', 'CBOX', 'Ciclo',
+                    'Paneles Limpiados', 'Strings', 'Potencia DC Asociada']
+
+# Granularidad → formato strftime del período (mismo criterio que PERIODOS_SQL)
+PERIODOS_ARROW = {'Día': '%Y-%m-%d', 'Semana': '%Y-W%W', 'Mes': '%Y-%m'}
+
+
+def guardar_archivo_arrow(df_reg: pd.DataFrame, planta: str, raiz=None) -> int:
+    """Escribe el registro normalizado en particiones planta/mes; retorna particiones escritas
+
+    Cada mes presente en el registro reemplaza completo a su partición (el archivo
+    de una planta trae el registro acumulado); la escritura es atómica por partición.
+    """
+    if len(df_reg) == 0:
+        return 0
+    carpeta = Path(raiz or ARCHIVO_ARROW) / f"planta={quote(planta, safe='')}"
+    carpeta.mkdir(parents=True, exist_ok=True)
+    columnas = [c for c in COLUMNAS_ARCHIVO if c in df_reg.columns]
+    meses = df_reg['Fecha'].dt.strftime('%Y-%m')
+
+    escritas = 0
+    for mes, parte in df_reg[columnas].groupby(meses.to_numpy(), sort=True):
+        tabla = pa.Table.from_pandas(parte.sort_values('Fecha', kind='stable'), preserve_index=False)
+        temporal = carpeta / f'.{mes}.arrow.tmp'
+        with pa.OSFile(str(temporal), 'wb') as destino, pa.ipc.new_file(destino, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+        os.replace(temporal, carpeta / f'{mes}.arrow')
+        escritas += 1
+    return escritas
+
+
+def particiones_arrow(plantas: list = None, desde=None, hasta=None, raiz=None) -> list:
+    """(planta, mes, ruta) de las particiones que pueden tener datos del filtro (solo por nombre)"""
+    raiz = Path(raiz or ARCHIVO_ARROW)
+    if not raiz.is_dir():
+        return []
+    mes_desde = pd.Timestamp(desde).strftime('%Y-%m') if desde is not None else None
+    mes_hasta = pd.Timestamp(hasta).strftime('%Y-%m') if hasta is not None else None
+    particiones = []
+    for carpeta in sorted(raiz.glob('planta=*')):
+        planta = unquote(carpeta.name[len('planta='):])
+        if plantas and planta not in plantas:
+            continue
+        for ruta in sorted(carpeta.glob('*.arrow')):
+            mes = ruta.stem
+            if (mes_desde and mes < mes_desde) or (mes_hasta and mes > mes_hasta):
+                continue
+            particiones.append((planta, mes, ruta))
+    return particiones
+
+
+def plantas_archivo_arrow(raiz=None) -> list:
+    """Plantas presentes en el archivo Arrow"""
+    return sorted({planta for planta, _, _ in particiones_arrow(raiz=raiz)})
+
+
+def leer_archivo_arrow(plantas: list = None, desde=None, hasta=None, columnas: list = None, raiz=None) -> pa.Table:
+    """Tabla Arrow (memory-mapped) con las columnas pedidas + 'Planta'; None si no hay datos
+
+    Solo los meses de borde del rango se filtran fila a fila (eso sí copia); los
+    meses completos quedan como vistas sobre el mapa.
+    """
+    inicio = pd.Timestamp(desde) if desde is not None else None
+    fin = pd.Timestamp(hasta) if hasta is not None else None
+    tablas = []
+    for planta, mes, ruta in particiones_arrow(plantas, desde, hasta, raiz):
+        fuente = pa.memory_map(str(ruta), 'r')
+        esquema = pa.ipc.open_file(fuente).schema
+        pedidas = [c for c in (columnas or esquema.names) if c in esquema.names]
+        necesarias = pedidas + (['Fecha'] if 'Fecha' not in pedidas and (inicio is not None or fin is not None) else [])
+        opciones = pa.ipc.IpcReadOptions(included_fields=[esquema.get_field_index(c) for c in necesarias])
+        tabla = pa.ipc.open_file(fuente, options=opciones).read_all()
+
+        primer_dia = pd.Timestamp(f'{mes}-01')
+        if inicio is not None and primer_dia < inicio:
+            tabla = tabla.filter(pc.field('Fecha') >= inicio)
+        if fin is not None and primer_dia + pd.offsets.MonthEnd(0) > fin:
+            tabla = tabla.filter(pc.field('Fecha') <= fin)
+        tabla = tabla.select(pedidas)
+        if tabla.num_rows == 0:
+            continue
+        planta_col = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(tabla.num_rows, dtype=np.int32)), pa.array([planta]))
+        tablas.append(tabla.append_column('Planta', planta_col))
+
+    if not tablas:
+        return None
+    return pa.concat_tables(tablas, promote_options='permissive')
+
+
+def periodo_arrow(fechas: pa.ChunkedArray, formato: str) -> pa.ChunkedArray:
+    """Etiqueta de período por fila formateando solo las fechas distintas (pocas) y no cada fila"""
+    unicas = pc.unique(fechas)
+    etiquetas = pc.strftime(unicas, format=formato)
+    return pc.take(etiquetas, pc.index_in(fechas, value_set=unicas))
+
+
+def consultar_archivo_arrow(granularidad: str = 'Mes', plantas: list = None, desde=None, hasta=None,
+                            inversores: list = None, cboxes: list = None, raiz=None) -> pd.DataFrame:
+    """Agregados por planta y período sobre el archivo Arrow (mismas columnas que consultar_historico)"""
+    filtros = [(col, valores) for col, valores in [('Inversor', inversores), ('CBOX', cboxes)] if valores]
+    columnas = ['Fecha', 'Tracker', 'Paneles Limpiados', 'Strings', 'Potencia DC Asociada'] + [c for c, _ in filtros]
+    tabla = leer_archivo_arrow(plantas, desde, hasta, columnas, raiz)
+    columnas_salida = ['Planta', 'Periodo', 'Paneles Limpiados', 'Strings', 'Potencia DC (kW)', 'Trackers', 'Días Activos']
+    if tabla is None:
+        return pd.DataFrame(columns=columnas_salida)
+
+    for col, valores in filtros:
+        if col in tabla.column_names:
+            tabla = tabla.filter(pc.is_in(pc.cast(tabla[col], pa.string()), value_set=pa.array(valores, pa.string())))
+    tabla = tabla.append_column('Periodo', periodo_arrow(tabla['Fecha'], PERIODOS_ARROW[granularidad]))
+    tabla = tabla.set_column(tabla.schema.get_field_index('Planta'), 'Planta', pc.cast(tabla['Planta'], pa.string()))
+    tabla = tabla.set_column(tabla.schema.get_field_index('Tracker'), 'Tracker', pc.cast(tabla['Tracker'], pa.string()))
+
+    # Suma de un grupo sin valores = 0, igual que el histórico SQLite
+    suma = pc.ScalarAggregateOptions(min_count=0)
+    agregados = [('Paneles Limpiados', 'sum', suma), ('Tracker', 'count_distinct'), ('Fecha', 'count_distinct')]
+    agregados += [(c, 'sum', suma) for c in ('Strings', 'Potencia DC Asociada') if c in tabla.column_names]
+    resultado = tabla.group_by(['Planta', 'Periodo']).aggregate(agregados).to_pandas()
+
+    resultado = resultado.rename(columns={
+        'Paneles Limpiados_sum': 'Paneles Limpiados', 'Strings_sum': 'Strings',
+        'Potencia DC Asociada_sum': 'Potencia DC (kW)', 'Tracker_count_distinct': 'Trackers',
+        'Fecha_count_distinct': 'Días Activos',
+    })
+    if 'Potencia DC (kW)' in resultado.columns:
+        resultado['Potencia DC (kW)'] = resultado['Potencia DC (kW)'].astype('float64').round(1)
+    return (resultado.reindex(columns=columnas_salida)
+            .sort_values(['Periodo', 'Planta'], kind='stable').reset_index(drop=True))
 
 
 # ─────────────────────────────────────────────
-# CONTENIDO PRINCIPAL
+# DATASETS COMPARTIDOS ENTRE SESIONES
 # ─────────────────────────────────────────────
 
-# Header principal
-st.markdown("""
-<div class="main-header">
-    <h1>Dashboard Limpieza</h1>
-    <p>Sistema Universal de Control de Operaciones</p>
-</div>
-""", unsafe_allow_html=True)
+MEMORIA_MAX_MB   = float(os.environ.get('LIMPIEZA_MEMORIA_MB') or 2048)  # presupuesto total del servidor para datasets cargados
+INACTIVIDAD_MAX_S = 1800  # sesión sin uso por más de esto ya no retiene su dataset
+
+
+def tamano_objeto(obj) -> int:
+    """Bytes aproximados de un dataset (DataFrames, arrays y contenedores anidados)"""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(tamano_objeto(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(tamano_objeto(v) for v in obj)
+    return 0
+
+
+class PresupuestoExcedido(MemoryError):
+    """El almacén no tiene espacio para otro dataset sin desalojar sesiones activas
+
+    Hereda de MemoryError para capturarla por la clase builtin: cada rerun vuelve a
+    ejecutar app.py y define una clase nueva, pero el almacén cacheado sigue lanzando
+    la del primer run.
+    """
+
+
+class AlmacenDatasets:
+    """Una única copia por proceso de cada dataset cargado, compartida entre sesiones
+
+    Las sesiones adquieren un dataset por clave (hash del archivo) y lo liberan al
+    cambiar de archivo; cada entrada cuenta qué sesiones la usan y cuándo lo usaron
+    por última vez (adquirir o tocar). Para hacer lugar se desalojan primero los
+    datasets sin sesiones (LRU) y luego los que solo retienen sesiones inactivas; si
+    aun así no cabe, la carga nueva se rechaza con PresupuestoExcedido. Los datasets
+    se tratan como inmutables: los filtros y vistas de cada sesión trabajan sobre copias.
+    """
+
+    def __init__(self, memoria_max_mb: float = MEMORIA_MAX_MB, inactividad_max_s: float = INACTIVIDAD_MAX_S):
+        self.memoria_max = int(memoria_max_mb * 1024 * 1024)
+        self.inactividad_max_s = inactividad_max_s
+        self._lock = threading.Lock()
+        self._cargas = {}    # clave → Lock (una sola carga concurrente por archivo)
+        self._entradas = {}  # clave → {'data', 'bytes', 'sesiones': {id: último uso}, 'ultimo_uso'}
+
+    def adquirir(self, clave: str, sesion: str, cargar) -> dict:
+        """Retorna el dataset de `clave`, cargándolo con `cargar()` si no está en memoria"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                return self._registrar(entrada, sesion)
+            if not self._hacer_lugar(0):
+                raise PresupuestoExcedido(self._mensaje_lleno())
+            carga = self._cargas.setdefault(clave, threading.Lock())
+
+        with carga:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                if entrada is not None:
+                    return self._registrar(entrada, sesion)
+            data = cargar()
+            with self._lock:
+                self._cargas.pop(clave, None)
+                if not data:
+                    return data
+                tamano = tamano_objeto(data)
+                if not self._hacer_lugar(tamano):
+                    raise PresupuestoExcedido(self._mensaje_lleno(tamano))
+                entrada = {'data': data, 'bytes': tamano, 'sesiones': {}, 'ultimo_uso': time.time()}
+                self._entradas[clave] = entrada
+                return self._registrar(entrada, sesion)
+
+    def publicar(self, clave: str, data: dict) -> bool:
+        """Deja un dataset ya cargado disponible para las sesiones (sin retenerlo)
+
+        Retorna False si no cabe en el presupuesto; las sesiones lo cargarán a pedido.
+        """
+        with self._lock:
+            if clave in self._entradas:
+                return True
+            tamano = tamano_objeto(data)
+            if not self._hacer_lugar(tamano):
+                return False
+            self._entradas[clave] = {'data': data, 'bytes': tamano, 'sesiones': {}, 'ultimo_uso': time.time()}
+            return True
+
+    def tocar(self, clave: str, sesion: str):
+        """Marca a la sesión como activa en el dataset sin volver a adquirirlo"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._registrar(entrada, sesion)
+
+    def liberar(self, clave: str, sesion: str):
+        """La sesión deja de usar el dataset; queda disponible para desalojo"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                entrada['sesiones'].pop(sesion, None)
+            self._hacer_lugar(0)
+
+    def estado(self) -> dict:
+        """Resumen para monitoreo: datasets, sesiones y memoria usada"""
+        with self._lock:
+            return {
+                'datasets': len(self._entradas),
+                'sesiones': sum(len(e['sesiones']) for e in self._entradas.values()),
+                'bytes': sum(e['bytes'] for e in self._entradas.values()),
+                'bytes_max': self.memoria_max,
+            }
+
+    def _registrar(self, entrada: dict, sesion: str) -> dict:
+        ahora = time.time()
+        entrada['sesiones'][sesion] = ahora
+        entrada['ultimo_uso'] = ahora
+        return entrada['data']
+
+    def _hacer_lugar(self, nuevos: int) -> bool:
+        """Desaloja hasta que `nuevos` bytes quepan en el presupuesto; False si no se pudo"""
+        # Se llama con el lock tomado
+        ahora = time.time()
+        for entrada in self._entradas.values():
+            entrada['sesiones'] = {s: t for s, t in entrada['sesiones'].items()
+                                   if ahora - t <= self.inactividad_max_s}
+        total = sum(e['bytes'] for e in self._entradas.values())
+        candidatos = sorted(
+            (clave for clave, e in self._entradas.items() if not e['sesiones']),
+            key=lambda clave: self._entradas[clave]['ultimo_uso']
+        )
+        for clave in candidatos:
+            if total + nuevos <= self.memoria_max:
+                break
+            total -= self._entradas.pop(clave)['bytes']
+        return total + nuevos <= self.memoria_max
+
+    def _mensaje_lleno(self, nuevos: int = 0) -> str:
+        usados = sum(e['bytes'] for e in self._entradas.values())
+        return (f"Memoria del servidor ocupada por sesiones activas ({usados / 2**20:.1f} MB"
+                f"{f' + {nuevos / 2**20:.1f} MB' if nuevos else ''} de {self.memoria_max / 2**20:.0f} MB); "
+                f"intenta nuevamente en unos minutos.")
+
+
+@st.cache_resource
+def almacen_compartido() -> AlmacenDatasets:
+    """Almacén único del proceso (compartido por todas las sesiones)"""
+    return AlmacenDatasets()
+
+
+def id_sesion() -> str:
+    """Identificador de la sesión de Streamlit actual"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+
+def procesar_contenido(contenido: bytes, nombre: str, base: bytes = None, cargar=load_excel) -> dict:
+    """Procesa un archivo en memoria y lo incorpora al histórico local
+
+    `cargar` es load_excel (errores a la sesión) o procesar_libro (errores como excepción).
+    """
+    buf = io.BytesIO(contenido)
+    buf.name = nombre
+    data = cargar(buf, io.BytesIO(base) if base is not None else None)
+    if data:
+        try:
+            guardar_historico(data['registro'], data['nombre'])
+            guardar_archivo_arrow(data['registro'], data['nombre'])
+        except Exception as e:
+            st.warning(f"⚠️ No se pudo guardar en el histórico: {str(e)}")
+    return data
+
+
+def usar_dataset(clave: str, cargar) -> dict:
+    """La sesión pasa a usar el dataset `clave` (liberando el anterior si cambió)"""
+    almacen = almacen_compartido()
+    sesion = id_sesion()
+
+    anterior = st.session_state.get('dataset')
+    if anterior and anterior != clave:
+        almacen.liberar(anterior, sesion)
+        for key in FILTROS + ['informes']:
+            st.session_state.pop(key, None)
+    st.session_state['dataset'] = clave
+    try:
+        return almacen.adquirir(clave, sesion, cargar)
+    except MemoryError as e:  # PresupuestoExcedido de cualquier run
+        st.error(f"❌ {e}")
+        return None
+
+
+def mantener_dataset():
+    """Renueva la actividad de la sesión en su dataset (los fragments no pasan por usar_dataset)"""
+    clave = st.session_state.get('dataset')
+    if clave:
+        almacen_compartido().tocar(clave, id_sesion())
+
+
+def cargar_archivo(contenido: bytes, nombre: str, base: bytes = None) -> dict:
+    """Obtiene el dataset del archivo desde el almacén compartido (lo carga una sola vez)
+
+    `base` es el contenido de un BASE_DATOS aparte (registro en CSV/Parquet).
+    Cada archivo nuevo para el proceso se incorpora al histórico local.
+    """
+    huella = hashlib.sha256(contenido)
+    if base is not None:
+        huella.update(hashlib.sha256(base).digest())
+    return usar_dataset(huella.hexdigest(), lambda: procesar_contenido(contenido, nombre, base))
 
 
-# ── Sin archivo cargado → pantalla de bienvenida ──
-if not uploaded_file:
+def soltar_archivo():
+    """La sesión ya no tiene archivo cargado: libera su dataset"""
+    anterior = st.session_state.pop('dataset', None)
+    if anterior:
+        almacen_compartido().liberar(anterior, id_sesion())
+
+
+# ─────────────────────────────────────────────
+# CARPETA VIGILADA (INGESTA AUTOMÁTICA)
+# ─────────────────────────────────────────────
+# Con LIMPIEZA_CARPETA definida, un hilo de fondo revisa la carpeta cada
+# INTERVALO_VIGILANCIA_S y vuelve a procesar solo los libros nuevos o modificados;
+# el resultado se publica en el almacén compartido sin bloquear a las sesiones.
+
+CARPETA_VIGILADA = os.environ.get('LIMPIEZA_CARPETA')
+PATRON_VIGILADO = 'limpieza_en_seco_*.xlsx'
+INTERVALO_VIGILANCIA_S = 30
+ESPERA_ESCRITURA_S = 2   # archivo modificado hace menos que esto → aún se está copiando
+
+
+class VigilanteCarpeta:
+    """Hilo que mantiene procesados los libros de una carpeta
+
+    Cada archivo se salta si su (mtime, tamaño) no cambió; si cambió pero el
+    contenido es el mismo (hash) solo se actualiza la marca. Los cambios reales se
+    cargan fuera de cualquier lock y se publican en el almacén con la clave del
+    contenido, la misma que usa una subida manual del mismo archivo.
+    """
+
+    def __init__(self, carpeta, almacen: AlmacenDatasets, patron: str = PATRON_VIGILADO,
+                 intervalo_s: float = INTERVALO_VIGILANCIA_S):
+        self.carpeta = Path(carpeta)
+        self.almacen = almacen
+        self.patron = patron
+        self.intervalo_s = intervalo_s
+        self._lock = threading.Lock()
+        self._archivos = {}  # ruta → {'nombre', 'mtime', 'tamano', 'clave', 'actualizado', 'error'}
+        self.error = None    # falla de la última pasada completa (p.ej. carpeta inaccesible)
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name='vigilante-carpeta', daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._parar.set()
+
+    def archivos(self) -> dict:
+        """Copia del estado de cada archivo vigilado (ruta → info)"""
+        with self._lock:
+            return {ruta: dict(info) for ruta, info in self._archivos.items()}
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            try:
+                self.escanear()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+            self._parar.wait(self.intervalo_s)
+
+    def escanear(self):
+        """Una pasada por la carpeta; retorna las rutas que se volvieron a procesar"""
+        procesadas = []
+        vistos = set()
+        ahora = time.time()
+        for ruta in sorted(self.carpeta.glob(self.patron)):
+            try:
+                stat = ruta.stat()
+            except FileNotFoundError:
+                continue
+            clave_ruta = str(ruta)
+            vistos.add(clave_ruta)
+            with self._lock:
+                previo = self._archivos.get(clave_ruta)
+            if previo and (previo['mtime'], previo['tamano']) == (stat.st_mtime, stat.st_size):
+                continue
+            if ahora - stat.st_mtime < ESPERA_ESCRITURA_S:
+                continue
+
+            info = {'nombre': ruta.name, 'mtime': stat.st_mtime, 'tamano': stat.st_size,
+                    'clave': None, 'actualizado': ahora, 'error': None}
+            try:
+                contenido = ruta.read_bytes()
+                info['clave'] = hashlib.sha256(contenido).hexdigest()
+                if previo and previo['clave'] == info['clave']:
+                    info.update(actualizado=previo['actualizado'], error=previo['error'])
+                else:
+                    data = procesar_contenido(contenido, ruta.name, cargar=procesar_libro)
+                    if data:
+                        self.almacen.publicar(info['clave'], data)
+                        procesadas.append(clave_ruta)
+                    else:
+                        info['error'] = "No se pudo procesar el archivo"
+            except LibroInvalido as e:
+                # El error queda en el estado del archivo; la sesión que lo elija lo muestra
+                info['error'] = str(e)
+            except Exception as e:
+                info['error'] = f"Error al procesar el archivo: {str(e)}"
+            with self._lock:
+                self._archivos[clave_ruta] = info
+
+        with self._lock:
+            for ruta in set(self._archivos) - vistos:
+                del self._archivos[ruta]
+        return procesadas
+
+
+@st.cache_resource
+def iniciar_vigilante(carpeta: str) -> VigilanteCarpeta:
+    """Un único vigilante por carpeta en el proceso"""
+    return VigilanteCarpeta(carpeta, almacen_compartido()).iniciar()
+
+
+def vigilante_carpeta() -> VigilanteCarpeta:
+    """Vigilante de LIMPIEZA_CARPETA, o None si no está configurada o aún no existe
+
+    El None no se cachea: si la carpeta aparece después, el siguiente rerun arranca el vigilante.
+    """
+    if not CARPETA_VIGILADA or not Path(CARPETA_VIGILADA).is_dir():
+        return None
+    return iniciar_vigilante(CARPETA_VIGILADA)
+
+
+def cargar_vigilado(ruta: str) -> dict:
+    """Dataset de un archivo de la carpeta vigilada (la versión más reciente procesada)"""
+    vigilante = vigilante_carpeta()
+    info = vigilante.archivos().get(ruta) if vigilante else None
+    if info is None:
+        st.warning("⚠️ El archivo ya no está en la carpeta vigilada.")
+        return None
+    if info['error']:
+        st.error(f"❌ {info['nombre']}: {info['error']}")
+        return None
+    return usar_dataset(info['clave'], lambda: procesar_contenido(Path(ruta).read_bytes(), info['nombre']))
+
+
+# ─────────────────────────────────────────────
+# SECCIONES DEL DASHBOARD
+# ─────────────────────────────────────────────
+# Cada sección recibe explícitamente los datos que usa. Las marcadas con
+# @st.fragment se re-ejecutan solas cuando cambia uno de sus widgets:
+#   seccion_analisis  ← filtros → KPIs, gráficos, tabla (y descargas)
+#   seccion_descargas ← botones de informe, sin tocar el resto
+
+FILTROS = ['f_fecha', 'f_inversor', 'f_cbox', 'f_tracker']
+
+
+def render_sidebar():
+    """Sidebar con la carga de archivo; retorna (archivo, base aparte, ruta vigilada)
+
+    El archivo subido tiene prioridad sobre la selección de la carpeta vigilada.
+    """
+    with st.sidebar:
+        st.markdown("""
+        <div style="text-align:center; padding: 20px 0 10px;">
+            <span style="font-size:2em;">⚡</span>
+            <h2 style="color:#667eea; margin:5px 0;">Limpieza</h2>
+            <p style="color:#888; font-size:0.85em;">Dashboard Universal</p>
+        </div>
+        <hr style="border-color:#eee; margin-bottom:20px;">
+        """, unsafe_allow_html=True)
+
+        st.markdown("### 📁 Cargar Archivo")
+        uploaded_file = st.file_uploader(
+            "Selecciona el archivo de limpieza",
+            type=FORMATOS_ARCHIVO,
+            help="Excel con las hojas REGISTRO_DIARIO y BASE_DATOS, o el registro diario en CSV/Parquet"
+        )
+
+        # CSV/Parquet traen una sola tabla: BASE_DATOS se sube aparte
+        uploaded_base = None
+        if uploaded_file and Path(uploaded_file.name).suffix.lower() in ('.csv', '.parquet'):
+            uploaded_base = st.file_uploader(
+                "BASE_DATOS (opcional)",
+                type=FORMATOS_ARCHIVO,
+                help="Tabla Tracker → CBOX → Inversor con los paneles de cada tracker"
+            )
+
+        # Libros de la carpeta vigilada (ingesta automática)
+        vigilado = None
+        vigilante = vigilante_carpeta()
+        archivos = vigilante.archivos() if vigilante else {}
+        if vigilante and vigilante.error:
+            st.warning(f"⚠️ Carpeta vigilada: {vigilante.error}")
+        if archivos:
+            st.markdown("### 📂 Carpeta Vigilada")
+            vigilado = st.selectbox(
+                "Planta",
+                [None] + list(archivos),
+                format_func=lambda ruta: '—' if ruta is None else nombre_planta(archivos[ruta]['nombre']),
+                key='vigilado',
+                help=f"Archivos {PATRON_VIGILADO} de {vigilante.carpeta}, actualizados automáticamente"
+            )
+            if vigilado:
+                actualizado = pd.Timestamp(archivos[vigilado]['actualizado'], unit='s', tz='UTC').tz_convert(None)
+                st.caption(f"🔄 Procesado: {actualizado:%Y-%m-%d %H:%M} UTC")
+
+        st.markdown("---")
+    return uploaded_file, uploaded_base, vigilado
+
+
+def render_header():
+    """Header principal"""
+    st.markdown("""
+    <div class="main-header">
+        <h1>Dashboard Limpieza</h1>
+        <p>Sistema Universal de Control de Operaciones</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+
+def render_bienvenida():
+    """Pantalla de bienvenida sin archivo cargado"""
     st.markdown("""
     <div class="upload-section">
-        <h2 style="color:#667eea; margin-bottom:15px;">📂 Carga tu archivo Excel</h2>
+        <h2 style="color:#667eea; margin-bottom:15px;">📂 Carga tu archivo de limpieza</h2>
         <p style="color:#888; margin-bottom:20px;">
             Usa el panel izquierdo para seleccionar tu archivo de limpieza
         </p>
@@ -952,136 +3190,350 @@ if not uploaded_file:
             <p style="color:#555;"><strong>El archivo debe contener:</strong></p>
             <p style="color:#666;">✅ Hoja <code>REGISTRO_DIARIO</code></p>
             <p style="color:#666;">✅ Hoja <code>BASE_DATOS</code></p>
+            <p style="color:#666;">📄 También CSV o Parquet con el registro diario (BASE_DATOS aparte)</p>
             <p style="color:#666; margin-top:10px;"><strong>Compatible con cualquier planta:</strong></p>
             <p style="color:#666;">⚡ Planta Sauce &nbsp;|&nbsp; 🌳 Planta El Roble &nbsp;|&nbsp; 🏭 Otras plantas</p>
         </div>
     </div>
     """, unsafe_allow_html=True)
-    st.stop()
 
 
-# ── Procesar archivo ──────────────────────────
-with st.spinner("⏳ Procesando archivo..."):
-    data = load_excel(uploaded_file)
+@st.fragment
+def seccion_validacion(validacion: pd.DataFrame, planta: str):
+    """Aviso de problemas de calidad con el reporte fila a fila descargable"""
+    if validacion is None or len(validacion) == 0:
+        return
+    resumen = validacion['Problema'].value_counts()
+    st.warning(
+        f"⚠️ Se encontraron {len(validacion):,} problemas de calidad en el archivo: "
+        + ', '.join(f'{problema} ({n:,})' for problema, n in resumen.items())
+    )
+    with st.expander("Ver problemas de calidad"):
+        st.dataframe(validacion, use_container_width=True, hide_index=True, height=300)
+        st.download_button(
+            label="📋 Descargar reporte de problemas (CSV)",
+            data=validacion.to_csv(index=False).encode('utf-8-sig'),
+            file_name=f"Validacion_{planta}_{date.today().strftime('%Y%m%d')}.csv",
+            mime="text/csv",
+        )
+
+
+def seccion_planta(data: dict):
+    """Estado de la planta completa: pronóstico, cobertura y ciclos (no depende de filtros)"""
+    df_prog = data['progreso']
+
+    # ── Pronóstico de término ─────────────────────
+    render_pronostico(pronosticar_termino(df_prog), df_prog)
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # ── Cobertura de planta ───────────────────────
+    if data['cobertura'] is not None:
+        render_cobertura(data['cobertura'])
+        st.markdown("<br>", unsafe_allow_html=True)
+
+    # ── Ciclos de limpieza ────────────────────────
+    render_ciclos(data['ciclos'])
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # ── Heatmap tracker × día ─────────────────────
+    render_heatmap(data['matriz'])
+    st.markdown("<br>", unsafe_allow_html=True)
+
+
+def render_filtros(data: dict) -> tuple:
+    """Controles de filtro; retorna (fecha, inversores, cboxes, trackers)"""
+    df_reg    = data['registro']
+    jerarquia = data['jerarquia']
+
+    fecha_min  = df_reg['Fecha'].min().date()
+    fecha_max  = df_reg['Fecha'].max().date()
+    inversores = sorted(df_reg['Inversor'].dropna().unique().tolist())
+    trackers   = sorted(df_reg['Tracker'].dropna().unique().tolist())
+
+    cbox_opts = []
+    if jerarquia is not None:
+        cbox_opts = sorted(jerarquia['CBOX'].dropna().unique().tolist())
+    elif 'CBOX' in df_reg.columns:
+        cbox_opts = sorted(df_reg['CBOX'].dropna().unique().tolist())
+
+    st.markdown("### 🔍 Filtros")
+    col_f, col_i, col_c, col_t, col_r = st.columns([2, 2, 2, 2, 1])
+    # Vacío = Todos
+    with col_f:
+        sel_fecha = st.date_input("📅 Rango de Fechas", value=(fecha_min, fecha_max),
+                                  min_value=fecha_min, max_value=fecha_max, key='f_fecha')
+    with col_i:
+        sel_inversor = st.multiselect("🔌 Inversor", inversores, placeholder='Todos', key='f_inversor')
+    with col_c:
+        sel_cbox = st.multiselect("📦 CBOX", cbox_opts, placeholder='Todos', key='f_cbox')
+    with col_t:
+        sel_tracker = st.multiselect("🎯 Tracker", trackers, placeholder='Todos', key='f_tracker')
+    with col_r:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if st.button("🔄 Resetear", use_container_width=True):
+            for key in FILTROS:
+                st.session_state.pop(key, None)
+            st.rerun(scope='fragment')
+
+    return sel_fecha, sel_inversor, sel_cbox, sel_tracker
+
+
+@st.fragment
+def seccion_analisis(data: dict):
+    """Filtros → KPIs, gráficos, tabla y descargas de la selección"""
+    mantener_dataset()
+    df_reg  = data['registro']
+    planta  = data['nombre']
+
+    sel_fecha, sel_inversor, sel_cbox, sel_tracker = render_filtros(data)
+
+    # ── Aplicar filtros ───────────────────────────
+    df_filtered = apply_filters(df_reg, sel_fecha, sel_inversor, sel_cbox, sel_tracker, data['indices'])
+
+    if len(df_filtered) == 0:
+        st.warning("⚠️ No hay datos con los filtros seleccionados.")
+        return
+
+    # Recalcular progreso con datos filtrados
+    # (la capacidad de planta solo aplica si no se filtró por Inversor/CBOX/Tracker)
+    sin_filtro_dim = not (sel_inversor or sel_cbox or sel_tracker)
+    df_prog_filtered = calcular_progreso(df_filtered, data['capacidad'] if sin_filtro_dim else None)
+
+    # Título de planta
+    st.markdown(f"""
+    <div style="background:white; padding:15px 25px; border-radius:12px;
+         box-shadow:0 5px 20px rgba(0,0,0,0.15); margin-bottom:20px;
+         display:flex; align-items:center; justify-content:space-between;">
+        <h2 style="color:#667eea; margin:0;">Planta {planta}</h2>
+        <span style="color:#888; font-size:0.9em;">
+            {len(df_filtered):,} registros &nbsp;|&nbsp;
+            {df_filtered['Fecha'].nunique()} días &nbsp;|&nbsp;
+            {df_filtered['Tracker'].nunique()} trackers
+        </span>
+    </div>
+    """, unsafe_allow_html=True)
 
-if not data:
-    st.stop()
+    # ── KPIs ──────────────────────────────────────
+    render_kpis(df_filtered, df_prog_filtered)
 
-df_reg  = data['registro']
-df_base = data['base']
-df_prog = data['progreso']
-planta  = data['nombre']
+    st.markdown("<br>", unsafe_allow_html=True)
 
+    # ── Gráficos ──────────────────────────────────
+    render_charts(df_filtered, df_prog_filtered)
 
-# ── Filtros en sidebar ────────────────────────
-with st.sidebar:
-    fechas  = ['Todas'] + [str(f) for f in sorted(df_reg['Fecha'].unique())]
-    inversores = ['Todos'] + sorted(df_reg['Inversor'].dropna().unique().tolist())
-    trackers   = ['Todos'] + sorted(df_reg['Tracker'].dropna().unique().tolist())
+    st.markdown("<br>", unsafe_allow_html=True)
 
-    cbox_opts = ['Todos']
-    if df_base is not None and 'CBOX' in df_base.columns:
-        cbox_opts += sorted(df_base['CBOX'].dropna().unique().tolist())
+    # ── Tabla ─────────────────────────────────────
+    render_table(df_filtered, data['base'])
 
-    sel_fecha    = st.selectbox("📅 Fecha",    fechas)
-    sel_inversor = st.selectbox("🔌 Inversor", inversores)
-    sel_cbox     = st.selectbox("📦 CBOX",     cbox_opts)
-    sel_tracker  = st.selectbox("🎯 Tracker",  trackers)
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # ── Descargas ─────────────────────────────────
+    firma = (planta, str(sel_fecha), tuple(sel_inversor), tuple(sel_cbox), tuple(sel_tracker))
+    seccion_descargas(data, df_filtered, df_prog_filtered, firma)
 
-    if st.button("🔄 Resetear Filtros", use_container_width=True):
-        st.rerun()
 
+@st.fragment
+def seccion_descargas(data: dict, df_filtered: pd.DataFrame, df_prog_filtered: pd.DataFrame, firma: tuple):
+    """Genera los informes a pedido; sus botones solo re-ejecutan esta sección"""
+    mantener_dataset()
+    planta = data['nombre']
+    st.markdown("""
+    <div style="background:white; padding:25px; border-radius:15px;
+         box-shadow:0 10px 30px rgba(0,0,0,0.2); margin-bottom:20px;">
+        <h3 style="color:#667eea; margin-bottom:5px;">📥 Descargar Informe</h3>
+        <p style="color:#888; font-size:0.9em; margin-bottom:15px;">
+            Exporta el dashboard con los datos filtrados actualmente
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
 
-# ── Aplicar filtros ───────────────────────────
-df_filtered = apply_filters(df_reg, sel_fecha, sel_inversor, sel_cbox, sel_tracker)
+    # Los informes se guardan junto a la firma de filtros con que se generaron
+    informes = st.session_state.get('informes')
+    if informes is None or informes['firma'] != firma:
+        if not st.button("⚙️ Preparar informes de la selección", use_container_width=True):
+            return
+        with st.spinner("Preparando Excel y PDF..."):
+            inicio = time.perf_counter()
+            figs = construir_figuras(df_filtered, df_prog_filtered)
+            divs = figuras_a_divs(figs)
+            graficos = {'figuras': sum(fig is not None for fig in figs), 'segundos': time.perf_counter() - inicio}
+            html_pdf = generar_pdf_html(df_filtered, df_prog_filtered, planta, *figs, divs=divs)
+            # El interactivo no depende de los filtros: se reutiliza mientras no cambie el archivo
+            dataset = st.session_state.get('dataset')
+            interactivo = informes['interactivo'] if informes and informes.get('dataset') == dataset else \
+                generar_html_interactivo(data['registro'], planta, data['capacidad']).encode('utf-8')
+            informes = {
+                'dataset': dataset,
+                'firma': firma,
+                'excel': generar_excel(df_filtered, df_prog_filtered, planta),
+                'pdf':   html_pdf.encode('utf-8'),
+                'interactivo': interactivo,
+                'graficos': graficos,
+            }
+        st.session_state['informes'] = informes
+
+    graficos = informes['graficos']
+    st.caption(f"📈 {graficos['figuras']} gráficos construidos y serializados en {graficos['segundos']:.2f} s "
+               f"({graficos['figuras'] / max(graficos['segundos'], 1e-6):.0f} gráficos/s)")
+
+    col_xl, col_pdf, col_html = st.columns(3)
+
+    # ── Botón Excel ───────────────────────────────
+    with col_xl:
+        st.download_button(
+            label="📊 Descargar Excel",
+            data=informes['excel'],
+            file_name=f"Informe_Limpieza_{planta}_{date.today().strftime('%Y%m%d')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True,
+            help="Descarga el informe en formato Excel con 3 hojas: Resumen, Detalle y Progreso por Inversor"
+        )
 
-if len(df_filtered) == 0:
-    st.warning("⚠️ No hay datos con los filtros seleccionados.")
-    st.stop()
+    # ── Botón PDF ─────────────────────────────────
+    with col_pdf:
+        st.download_button(
+            label="📄 Descargar PDF",
+            data=informes['pdf'],
+            file_name=f"Informe_Limpieza_{planta}_{date.today().strftime('%Y%m%d')}.html",
+            mime="text/html",
+            use_container_width=True,
+            help="Descarga el informe como HTML. Ábrelo en el navegador y usa Ctrl+P para guardar como PDF"
+        )
+        st.caption("💡 Abre el archivo en el navegador → Ctrl+P → Guardar como PDF")
+
+    # ── Botón HTML interactivo ────────────────────
+    with col_html:
+        st.download_button(
+            label="🌐 Descargar HTML Interactivo",
+            data=informes['interactivo'],
+            file_name=f"Informe_Interactivo_{planta}_{date.today().strftime('%Y%m%d')}.html",
+            mime="text/html",
+            use_container_width=True,
+            help="Un solo archivo con filtros de fecha, inversor, CBOX y tracker que recalculan gráficos y KPIs en el navegador, sin conexión"
+        )
+        st.caption("💡 Incluye todos los datos de la planta; filtra dentro del archivo")
 
-# Recalcular progreso con datos filtrados
-df_prog_filtered = calcular_progreso(df_filtered)
 
-# Título de planta
-st.markdown(f"""
-<div style="background:white; padding:15px 25px; border-radius:12px;
-     box-shadow:0 5px 20px rgba(0,0,0,0.15); margin-bottom:20px;
-     display:flex; align-items:center; justify-content:space-between;">
-    <h2 style="color:#667eea; margin:0;">Planta {planta}</h2>
-    <span style="color:#888; font-size:0.9em;">
-        {len(df_filtered):,} registros &nbsp;|&nbsp;
-        {df_filtered['Fecha'].nunique()} días &nbsp;|&nbsp;
-        {df_filtered['Tracker'].nunique()} trackers
-    </span>
-</div>
-""", unsafe_allow_html=True)
+@st.fragment(run_every=INTERVALO_VIGILANCIA_S)
+def aviso_actualizacion(ruta: str, clave: str):
+    """Recarga la app cuando el vigilante publica una nueva versión del archivo mostrado"""
+    vigilante = vigilante_carpeta()
+    info = vigilante.archivos().get(ruta) if vigilante else None
+    if info and info['clave'] != clave and not info['error']:
+        st.rerun()
 
-# ── KPIs ──────────────────────────────────────
-render_kpis(df_filtered, df_prog_filtered)
 
-st.markdown("<br>", unsafe_allow_html=True)
+@st.fragment
+def seccion_historico():
+    """Consultas sobre el histórico de todas las cargas (SQLite o archivo Arrow)"""
+    fuentes = {
+        'Arrow': (plantas_archivo_arrow, consultar_archivo_arrow),
+        'SQLite': (plantas_historico, consultar_historico),
+    }
+    plantas_por_fuente = {nombre: listar() for nombre, (listar, _) in fuentes.items()}
+    disponibles = [nombre for nombre, plantas in plantas_por_fuente.items() if plantas]
+    if not disponibles:
+        return
 
-# ── Gráficos ──────────────────────────────────
-figs = render_charts(df_filtered, df_prog_filtered)
-fig_trackers, fig_progreso, fig_potencia, fig_fecha = figs
+    st.markdown('<div class="chart-card">', unsafe_allow_html=True)
+    st.markdown("### 🗂️ Histórico de Cargas")
+    col_p, col_g, col_f = st.columns([3, 1, 1])
+    with col_f:
+        fuente = st.radio("💽 Fuente", disponibles, horizontal=True, key='h_fuente',
+                          help="Arrow: particiones planta/mes con memory-map · SQLite: base histórica indexada")
+    plantas = plantas_por_fuente[fuente]
+    with col_p:
+        sel_plantas = st.multiselect("🏭 Plantas", plantas, default=plantas, key=f'h_plantas_{fuente}')
+    with col_g:
+        granularidad = st.selectbox("🗓️ Agrupar por", list(PERIODOS_SQL), index=2, key='h_granularidad')
+
+    historico = fuentes[fuente][1](granularidad, sel_plantas)
+    if len(historico) == 0:
+        st.info("Sin registros históricos para la selección.")
+    else:
+        fig = go.Figure()
+        for i, (planta, grupo) in enumerate(historico.groupby('Planta')):
+            fig.add_trace(go.Bar(
+                x=grupo['Periodo'].tolist(),
+                y=[int(v) for v in grupo['Paneles Limpiados'].tolist()],
+                name=planta,
+                marker_color=['#667eea', '#764ba2', '#4ecdc4', '#ff6b6b', '#a29bfe', '#fd79a8'][i % 6],
+            ))
+        fig.update_layout(
+            barmode='group',
+            plot_bgcolor='white', paper_bgcolor='white',
+            xaxis=dict(type='category'),
+            yaxis=dict(title='Paneles'),
+            height=320, margin=dict(t=20, b=40),
+            legend=dict(orientation='h', y=-0.2)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(historico, use_container_width=True, hide_index=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
-st.markdown("<br>", unsafe_allow_html=True)
 
-# ── Tabla ─────────────────────────────────────
-render_table(df_filtered, df_base)
+def render_footer():
+    """Footer"""
+    st.markdown("""
+    <div style="text-align:center; padding:20px; color:rgba(255,255,255,0.6); font-size:0.85em;">
+        Dashboard Limpieza en Seco · Sistema Universal de Control
+    </div>
+    """, unsafe_allow_html=True)
 
-st.markdown("<br>", unsafe_allow_html=True)
 
 # ─────────────────────────────────────────────
-# SECCIÓN DE DESCARGAS
+# CONTENIDO PRINCIPAL
 # ─────────────────────────────────────────────
-st.markdown("""
-<div style="background:white; padding:25px; border-radius:15px;
-     box-shadow:0 10px 30px rgba(0,0,0,0.2); margin-bottom:20px;">
-    <h3 style="color:#667eea; margin-bottom:5px;">📥 Descargar Informe</h3>
-    <p style="color:#888; font-size:0.9em; margin-bottom:15px;">
-        Exporta el dashboard con los datos filtrados actualmente
-    </p>
-</div>
-""", unsafe_allow_html=True)
-
-col_xl, col_pdf = st.columns(2)
-
-# ── Botón Excel ───────────────────────────────
-with col_xl:
-    with st.spinner("Preparando Excel..."):
-        excel_bytes = generar_excel(df_filtered, df_prog_filtered, planta)
-    st.download_button(
-        label="📊 Descargar Excel",
-        data=excel_bytes,
-        file_name=f"Informe_Limpieza_{planta}_{date.today().strftime('%Y%m%d')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        use_container_width=True,
-        help="Descarga el informe en formato Excel con 3 hojas: Resumen, Detalle y Progreso por Inversor"
-    )
 
-# ── Botón PDF ─────────────────────────────────
-with col_pdf:
-    with st.spinner("Preparando PDF..."):
-        html_pdf = generar_pdf_html(
-            df_filtered, df_prog_filtered, planta,
-            fig_trackers, fig_progreso, fig_potencia, fig_fecha
+def main():
+    st.set_page_config(**PAGE_CONFIG)
+    st.markdown(CSS, unsafe_allow_html=True)
+
+    uploaded_file, uploaded_base, vigilado = render_sidebar()
+    render_header()
+
+    # ── Sin archivo cargado → pantalla de bienvenida ──
+    if not uploaded_file and not vigilado:
+        soltar_archivo()
+        render_bienvenida()
+        return
+
+    # ── Procesar archivo ──────────────────────────
+    with st.spinner("⏳ Procesando archivo..."):
+        if uploaded_file:
+            data = cargar_archivo(
+                uploaded_file.getvalue(), uploaded_file.name,
+                uploaded_base.getvalue() if uploaded_base else None
+            )
+        else:
+            data = cargar_vigilado(vigilado)
+
+    if not data:
+        return
+
+    if not uploaded_file:
+        aviso_actualizacion(vigilado, st.session_state['dataset'])
+
+    with st.sidebar:
+        memoria = data['memoria']
+        st.caption(
+            f"💾 Registro en memoria: {memoria['antes'] / 1e6:.2f} MB → "
+            f"{memoria['despues'] / 1e6:.2f} MB (−{memoria['ahorro_pct']:.0f}%)"
+        )
+        estado = almacen_compartido().estado()
+        st.caption(
+            f"🗄️ Compartido: {estado['datasets']} dataset(s) · {estado['sesiones']} sesión(es) · "
+            f"{estado['bytes'] / 2**20:.1f} / {estado['bytes_max'] / 2**20:.0f} MB"
         )
-        pdf_bytes = html_pdf.encode('utf-8')
 
-    st.download_button(
-        label="📄 Descargar PDF",
-        data=pdf_bytes,
-        file_name=f"Informe_Limpieza_{planta}_{date.today().strftime('%Y%m%d')}.html",
-        mime="text/html",
-        use_container_width=True,
-        help="Descarga el informe como HTML. Ábrelo en el navegador y usa Ctrl+P para guardar como PDF"
-    )
-    st.caption("💡 Abre el archivo en el navegador → Ctrl+P → Guardar como PDF")
+    seccion_validacion(data['validacion'], data['nombre'])
+    seccion_planta(data)
+    seccion_analisis(data)
+    st.markdown("<br>", unsafe_allow_html=True)
+    seccion_historico()
+    render_footer()
 
-# ── Footer ────────────────────────────────────
-st.markdown("""
-<div style="text-align:center; padding:20px; color:rgba(255,255,255,0.6); font-size:0.85em;">
-    Dashboard Limpieza en Seco · Sistema Universal de Control
-</div>
-""", unsafe_allow_html=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Archivo Arrow del portafolio (particiones por planta y mes)
+
+    python archivo_portafolio.py importar /ruta/carpeta
+    python archivo_portafolio.py consultar --granularidad Mes --plantas Sauce Roble --desde 2024-01-01
+
+`importar` normaliza cada archivo de la carpeta con load_excel y escribe sus
+particiones; `consultar` agrega sobre el archivo con memory-map, leyendo solo las
+columnas y particiones que la consulta necesita.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from app import ARCHIVO_ARROW, PERIODOS_ARROW, consultar_archivo_arrow, guardar_archivo_arrow
+from informe_consolidado import plantas_en_carpeta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivo Arrow particionado por planta y mes")
+    parser.add_argument('--archivo', default=str(ARCHIVO_ARROW), help="Raíz del archivo")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    importar = comandos.add_parser('importar', help="Agrega al archivo los libros de una carpeta")
+    importar.add_argument('carpeta')
+
+    consultar = comandos.add_parser('consultar', help="Agregados por planta y período")
+    consultar.add_argument('--granularidad', choices=list(PERIODOS_ARROW), default='Mes')
+    consultar.add_argument('--plantas', nargs='*')
+    consultar.add_argument('--desde')
+    consultar.add_argument('--hasta')
+    consultar.add_argument('--inversores', nargs='*')
+    consultar.add_argument('--cboxes', nargs='*')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.comando == 'importar':
+        particiones = sum(
+            guardar_archivo_arrow(data['registro'], nombre, args.archivo)
+            for nombre, data in plantas_en_carpeta(Path(args.carpeta))
+        )
+        print(f"🗄️ {particiones} particiones escritas en {time.perf_counter() - inicio:.1f} s")
+    else:
+        resultado = consultar_archivo_arrow(
+            args.granularidad, args.plantas, args.desde, args.hasta,
+            args.inversores, args.cboxes, raiz=args.archivo
+        )
+        print(resultado.to_string(index=False))
+        print(f"⏱️ {len(resultado):,} filas en {time.perf_counter() - inicio:.3f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Informe mensual consolidado: un Excel con todas las plantas de una carpeta
+
+Lee cada limpieza_en_seco_*.xlsx (o .csv/.parquet) de a uno, escribe su hoja de
+detalle y lo libera antes de pasar al siguiente; la hoja resumen se completa al
+final. La memoria queda acotada a una planta a la vez.
+
+Uso:
+    python informe_consolidado.py /ruta/carpeta -o Informe_Consolidado.xlsx
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+from app import FORMATOS_ARCHIVO, generar_excel_consolidado, load_excel
+
+
+def plantas_en_carpeta(carpeta: Path):
+    """Genera (nombre, dataset) por cada archivo de limpieza de la carpeta"""
+    rutas = sorted(
+        ruta for ruta in carpeta.glob('limpieza_en_seco_*')
+        if ruta.suffix.lower().lstrip('.') in FORMATOS_ARCHIVO
+    )
+    for ruta in rutas:
+        inicio = time.perf_counter()
+        buf = io.BytesIO(ruta.read_bytes())
+        buf.name = ruta.name
+        data = load_excel(buf)
+        if not data:
+            print(f"⚠️ {ruta.name}: no se pudo procesar, se omite")
+            continue
+        print(f"✅ {data['nombre']}: {len(data['registro']):,} registros ({time.perf_counter() - inicio:.1f} s)")
+        yield data['nombre'], data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel consolidado de todas las plantas de una carpeta")
+    parser.add_argument('carpeta', type=Path)
+    parser.add_argument('-o', '--salida', type=Path, default=Path('Informe_Consolidado.xlsx'))
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    generar_excel_consolidado(plantas_en_carpeta(args.carpeta), args.salida)
+    print(f"📊 {args.salida} ({args.salida.stat().st_size / 2**20:.1f} MB) en {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Informes PDF (HTML) de todas las plantas de una carpeta, con los gráficos en paralelo
+
+Los 4 gráficos de cada planta se construyen y serializan en un pool de procesos
+(una planta por proceso); al final se reporta el rendimiento en gráficos/segundo.
+Junto a los informes se deja el pronóstico de término de todas las plantas (CSV).
+
+Uso:
+    python informes_lote.py /ruta/carpeta -o informes/ [--procesos 8]
+"""
+
+import argparse
+from datetime import date
+from pathlib import Path
+
+from app import generar_pdf_html, graficos_plantas, pronosticar_plantas
+from informe_consolidado import plantas_en_carpeta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Informes HTML por planta con gráficos en paralelo")
+    parser.add_argument('carpeta', type=Path)
+    parser.add_argument('-o', '--salida', type=Path, default=Path('informes'))
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos del pool (por defecto: CPUs)")
+    args = parser.parse_args()
+
+    datasets = dict(plantas_en_carpeta(args.carpeta))
+    divs, metricas = graficos_plantas(datasets, args.procesos)
+
+    args.salida.mkdir(parents=True, exist_ok=True)
+    for nombre, data in datasets.items():
+        html = generar_pdf_html(data['registro'], data['progreso'], nombre, *[None] * 4, divs=divs[nombre])
+        ruta = args.salida / f"Informe_Limpieza_{nombre}_{date.today().strftime('%Y%m%d')}.html"
+        ruta.write_text(html, encoding='utf-8')
+
+    pronostico = pronosticar_plantas(datasets)
+    pronostico.to_csv(args.salida / f"Pronostico_Plantas_{date.today().strftime('%Y%m%d')}.csv",
+                      index=False, encoding='utf-8-sig')
+    print(pronostico.to_string(index=False))
+
+    print(f"📈 {metricas['figuras']} gráficos de {metricas['plantas']} plantas en {metricas['segundos']:.2f} s "
+          f"→ {metricas['figuras_por_segundo']} gráficos/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Prueba de carga del dashboard con sesiones concurrentes (Streamlit AppTest, sin navegador)
+
+Simula N sesiones en un mismo proceso, como un servidor real: todas comparten los
+cachés (@st.cache_resource / @st.cache_data) y el almacén de datasets. Cada sesión
+sube un libro sintético y luego cambia filtros; se mide la latencia de cada rerun,
+el CPU del proceso y la memoria máxima (RSS).
+
+AppTest solo ejecuta reruns completos (sidebar, planta, heatmap y cobertura
+incluidos), así que un cambio de filtro se reporta en dos columnas:
+  - 'rerun completo': el script entero, lo que costaba antes de los fragments
+  - 'fragmento': solo el cuerpo de seccion_analisis, que es lo que re-ejecuta
+    un servidor real cuando el usuario cambia un filtro El histórico SQLite y el archivo
+Arrow de las sesiones se escriben en la carpeta temporal de la prueba.
+
+Uso:
+    python prueba_carga.py --sesiones 1,4,8 --reruns 10 --trackers 3000 --dias 180
+    python prueba_carga.py --sesiones 8 --distintos     # un archivo distinto por sesión
+    python prueba_carga.py --verificar-presupuesto      # rechazo por memoria en un rerun
+"""
+
+import argparse
+import io
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+APP = Path(__file__).with_name('app.py')
+
+# Script de cada sesión: el uploader entrega el libro sintético sin pasar por el navegador
+# (session_state['prueba_archivo'] permite cambiar de libro entre reruns)
+SCRIPT_SESION = '''
+import io, os, streamlit as st
+def _archivo(label, *args, **kwargs):
+    if label.startswith('BASE'):
+        return None
+    ruta = st.session_state.get('prueba_archivo', {ruta!r})
+    buf = io.BytesIO(open(ruta, 'rb').read())
+    buf.name = os.path.basename(ruta)
+    return buf
+st.file_uploader = _archivo
+__name__ = 'prueba_carga_app'
+__file__ = {app!r}
+exec(compile(open({app!r}, encoding='utf-8').read(), {app!r}, 'exec'))
+
+# El fragment de filtros se cronometra aparte: es lo único que corre al cambiar un filtro
+import time as _time
+_seccion_analisis = seccion_analisis
+def seccion_analisis(data):
+    inicio = _time.perf_counter()
+    _seccion_analisis(data)
+    st.session_state['prueba_t_fragmento'] = _time.perf_counter() - inicio
+main()
+'''
+
+
+# ─────────────────────────────────────────────
+# LIBRO SINTÉTICO
+# ─────────────────────────────────────────────
+
+def generar_libro(trackers: int = 3000, dias: int = 180, seed: int = 0) -> bytes:
+    """Libro con REGISTRO_DIARIO y BASE_DATOS de una planta de `trackers` trackers
+
+    Cada día se limpia un bloque contiguo de trackers, dando una vuelta completa a
+    la planta cada ~30 días (varios ciclos de limpieza en el período).
+    """
+    rng = np.random.default_rng(seed)
+    n_cbox = max(1, trackers // 20)
+    n_inv = max(1, n_cbox // 10)
+    idx = np.arange(trackers)
+    cbox = idx * n_cbox // trackers
+    base = pd.DataFrame({
+        'Tracker': [f'T{i + 1:05d}' for i in idx],
+        'CBOX': [f'CB{c + 1:04d}' for c in cbox],
+        'Inversor': [f'INV-{c * n_inv // n_cbox + 1:03d}' for c in cbox],
+        'Paneles': rng.integers(80, 120, trackers),
+        'Strings': 4,
+    })
+
+    por_dia = max(1, trackers // 30)
+    dia = np.repeat(np.arange(dias), por_dia)
+    fila = np.arange(dias * por_dia) % trackers
+    paneles = base['Paneles'].to_numpy()[fila]
+    registro = pd.DataFrame({
+        'Fecha': pd.Timestamp('2024-01-01') + pd.to_timedelta(dia, unit='D'),
+        'Tracker': base['Tracker'].to_numpy()[fila],
+        'Inversor': base['Inversor'].to_numpy()[fila],
+        'Paneles Limpiados': paneles,
+        'N° Strings': 4,
+        'Potencia DC Asociada': rng.uniform(40, 60, len(fila)).round(2),
+        'Paneles Acumulados': np.cumsum(paneles),
+    })
+
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine='openpyxl') as writer:
+        registro.to_excel(writer, sheet_name='REGISTRO_DIARIO', index=False)
+        base.to_excel(writer, sheet_name='BASE_DATOS', index=False)
+    return buf.getvalue()
+
+
+# ─────────────────────────────────────────────
+# MEDICIÓN DE RECURSOS
+# ─────────────────────────────────────────────
+
+def rss_actual() -> int:
+    """RSS actual del proceso en bytes (Linux: /proc/self/statm)"""
+    try:
+        paginas = int(Path('/proc/self/statm').read_text().split()[1])
+        return paginas * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MuestreoMemoria:
+    """Hilo que registra el RSS máximo mientras dura la prueba"""
+
+    def __init__(self, intervalo_s: float = 0.05):
+        self.intervalo_s = intervalo_s
+        self.maximo = rss_actual()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo_s):
+            self.maximo = max(self.maximo, rss_actual())
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        self.maximo = max(self.maximo, rss_actual())
+
+
+# ─────────────────────────────────────────────
+# SESIONES SIMULADAS
+# ─────────────────────────────────────────────
+
+def cambiar_filtros(at: AppTest, rng: random.Random):
+    """Aplica un cambio de filtro al azar, como haría un usuario"""
+    inversor = at.multiselect(key='f_inversor')
+    fecha = at.date_input(key='f_fecha')
+    accion = rng.choice(['inversor', 'fecha', 'limpiar'])
+    if accion == 'inversor' and inversor.options:
+        inversor.set_value(rng.sample(inversor.options, k=min(len(inversor.options), rng.randint(1, 3))))
+    elif accion == 'fecha' and isinstance(fecha.value, tuple):
+        inicio, fin = fecha.value[0], fecha.value[-1]
+        dias = max((fin - inicio).days, 1)
+        desde = inicio + pd.Timedelta(days=rng.randint(0, dias // 2))
+        fecha.set_value((desde, desde + pd.Timedelta(days=rng.randint(1, max(dias // 2, 1)))))
+    else:
+        inversor.set_value([])
+
+
+def sesion(script: str, reruns: int, seed: int, latencias: list, errores: list, timeout_s: float):
+    """Una sesión: carga inicial + `reruns` cambios de filtro; agrega latencias (s)"""
+    rng = random.Random(seed)
+    at = AppTest.from_string(script, default_timeout=timeout_s)
+    try:
+        for paso in range(reruns + 1):
+            if paso:
+                cambiar_filtros(at, rng)
+            inicio = time.perf_counter()
+            at.run()
+            latencias.append(('carga' if paso == 0 else 'rerun completo', time.perf_counter() - inicio))
+            if at.exception:
+                errores.append(at.exception[0].value)
+                return
+            if paso and 'prueba_t_fragmento' in at.session_state:
+                latencias.append(('fragmento', at.session_state['prueba_t_fragmento']))
+    except Exception as e:
+        errores.append(str(e))
+
+
+def ejecutar(n_sesiones: int, reruns: int, libros: list, timeout_s: float = 300) -> dict:
+    """Lanza `n_sesiones` concurrentes y retorna las métricas de la ronda"""
+    latencias, errores = [], []
+    scripts = [
+        SCRIPT_SESION.format(ruta=str(ruta), app=str(APP))
+        for ruta in libros
+    ]
+    hilos = [
+        threading.Thread(target=sesion, args=(scripts[i % len(scripts)], reruns, i, latencias, errores, timeout_s))
+        for i in range(n_sesiones)
+    ]
+
+    cpu_inicio, reloj_inicio = time.process_time(), time.perf_counter()
+    with MuestreoMemoria() as memoria:
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+    duracion = time.perf_counter() - reloj_inicio
+    cpu = time.process_time() - cpu_inicio
+
+    reruns_hechos = sum(tipo != 'fragmento' for tipo, _ in latencias)
+    resultado = {'Sesiones': n_sesiones, 'Reruns': reruns_hechos, 'Errores': len(errores)}
+    for tipo in ('carga', 'rerun completo', 'fragmento'):
+        valores = np.array([s for t, s in latencias if t == tipo]) * 1000
+        if len(valores):
+            for p in (50, 90, 99):
+                resultado[f'{tipo} p{p} (ms)'] = round(float(np.percentile(valores, p)), 1)
+            resultado[f'{tipo} máx (ms)'] = round(float(valores.max()), 1)
+    resultado.update({
+        'Reruns/s': round(reruns_hechos / duracion, 2),
+        'CPU (s)': round(cpu, 2),
+        'CPU (%)': round(cpu / duracion * 100, 1),
+        'RSS máx (MB)': round(memoria.maximo / 2**20, 1),
+    })
+    if errores:
+        print(f"⚠️ {n_sesiones} sesiones: {errores[0]}")
+    return resultado
+
+
+def verificar_presupuesto(carpeta: Path) -> bool:
+    """Con un presupuesto de 1 MB, un libro que no cabe en el segundo rerun debe dar st.error
+
+    El almacén cacheado sobrevive a los reruns; el rechazo tiene que mostrarse como
+    mensaje y no como excepción no capturada.
+    """
+    chico = carpeta / 'limpieza_en_seco_Chico.xlsx'
+    grande = carpeta / 'limpieza_en_seco_Grande.xlsx'
+    chico.write_bytes(generar_libro(30, 10))
+    grande.write_bytes(generar_libro(3000, 60))
+
+    at = AppTest.from_string(SCRIPT_SESION.format(ruta=str(chico), app=str(APP)), default_timeout=300)
+    at.run()
+    primero = not at.exception and not at.error
+    at.session_state['prueba_archivo'] = str(grande)
+    at.run()
+    segundo = not at.exception and any('Memoria del servidor' in e.value for e in at.error)
+    print(f"{'✅' if primero else '❌'} Rerun 1 (libro chico): carga sin errores")
+    print(f"{'✅' if segundo else '❌'} Rerun 2 (libro grande): "
+          f"{at.exception[0].value if at.exception else 'rechazo mostrado con st.error'}")
+    return primero and segundo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones concurrentes")
+    parser.add_argument('--sesiones', default='1,4,8', help="Sesiones concurrentes por ronda (lista separada por comas)")
+    parser.add_argument('--reruns', type=int, default=10, help="Cambios de filtro por sesión")
+    parser.add_argument('--trackers', type=int, default=3000)
+    parser.add_argument('--dias', type=int, default=180)
+    parser.add_argument('--distintos', action='store_true',
+                        help="Un libro distinto por sesión (sin compartir datasets)")
+    parser.add_argument('--verificar-presupuesto', action='store_true',
+                        help="Solo verifica el rechazo por presupuesto de memoria entre reruns")
+    args = parser.parse_args()
+    rondas = [int(n) for n in args.sesiones.split(',')]
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        # Antes de que las sesiones importen app: sus rutas de almacenamiento se leen del entorno
+        os.environ['LIMPIEZA_HISTORICO_DB'] = str(Path(carpeta) / 'historico_limpieza.db')
+        os.environ['LIMPIEZA_ARCHIVO_ARROW'] = str(Path(carpeta) / 'archivo_limpieza')
+        if args.verificar_presupuesto:
+            os.environ['LIMPIEZA_MEMORIA_MB'] = '1'
+            raise SystemExit(0 if verificar_presupuesto(Path(carpeta)) else 1)
+        n_libros = max(rondas) if args.distintos else 1
+        t = time.perf_counter()
+        libros = []
+        for i in range(n_libros):
+            ruta = Path(carpeta) / f'limpieza_en_seco_Carga{i + 1}.xlsx'
+            ruta.write_bytes(generar_libro(args.trackers, args.dias, seed=i))
+            libros.append(ruta)
+        print(f"📄 {n_libros} libro(s) de {args.trackers:,} trackers × {args.dias} días "
+              f"({libros[0].stat().st_size / 2**20:.1f} MB) en {time.perf_counter() - t:.1f} s")
+
+        resultados = [ejecutar(n, args.reruns, libros) for n in rondas]
+
+    print(pd.DataFrame(resultados).set_index('Sesiones').T.to_string())
+
+
+if __name__ == '__main__':
+    main()